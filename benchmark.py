@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+
+# Written by Gem Newman. This work is licensed under a Creative Commons
+# Attribution-NonCommercial-ShareAlike 3.0 Unported License.
+
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from math import ceil, log2
+from statistics import median
+from tempfile import mkdtemp
+from time import perf_counter
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tracemalloc
+
+
+# Seating, pairing, reporting, standings and player details are timed through
+# the Flask test client (so routing, loading, templates and commits are all
+# included) for every round of a synthetic tournament. The model-level parts of
+# the same work (loading the tournament, computing standings, running the
+# pairing engine and gathering a player's matches) are timed on their own. Each
+# measurement also records the number of SQL queries and (unless --no-memory is
+# given) the peak memory allocated while it ran. Tracing memory slows everything
+# down considerably, so it's measured by playing the same tournament again.
+
+RESULTS = [(2, 0, 0), (2, 1, 0), (0, 2, 0), (1, 2, 0), (1, 1, 1), (1, 0, 1)]
+
+
+def main():
+    description = "Benchmarks seating, pairing and standings for the Magic " \
+                  "tournament program."
+    parser = ArgumentParser(description=description)
+    parser.add_argument("-p", "--players", help="Tournament sizes to "
+                        "benchmark. Defaults to 8 64 512 2048.", type=int,
+                        nargs="+", default=[8, 64, 512, 2048])
+    parser.add_argument("-r", "--rounds", help="The number of rounds to play. "
+                        "Defaults to the usual number of Swiss rounds for "
+                        "each size (between 3 and 15).", type=int)
+    parser.add_argument("-d", "--drop-rate", help="The fraction of players "
+                        "who drop after each round. Defaults to 0.02.",
+                        type=float, default=0.02)
+    parser.add_argument("-n", "--repeat", help="How many times to repeat "
+                        "each measurement that doesn't change anything "
+                        "(the fastest time is reported). Defaults to 3.",
+                        type=int, default=3)
+    parser.add_argument("-s", "--seed", help="Seeds the random number "
+                        "generator, so that runs are comparable. Defaults to "
+                        "0.", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Writes the report (as JSON) "
+                        "to this file instead of standard output.")
+    parser.add_argument("-c", "--compare", help="A previous report. Exits "
+                        "with an error if any operation is now slower (by "
+                        "more than the tolerance) or uses more queries.")
+    parser.add_argument("-t", "--tolerance", help="The fraction by which "
+                        "times may exceed those in the compared report. "
+                        "Defaults to 0.25.", type=float, default=0.25)
+    parser.add_argument("--no-memory", help="Doesn't measure memory use, "
+                        "which halves the number of tournaments played.",
+                        action="store_true")
+    parser.add_argument("--history", help="Fills the database with this "
+                        "many finished tournaments first (as if it had been "
+                        "in use for years), and times looking things up in "
+                        "it, with and without indexes.", type=int, default=0)
+    parser.add_argument("--history-file", help="Like --history, but fills "
+                        "the database with the tournaments in an archive "
+                        "file (made by manage.py export).")
+    parser.add_argument("--keep", help="Keeps the generated database "
+                        "instead of deleting it.", action="store_true")
+    args = parser.parse_args()
+
+    # The app must be pointed at its own database before it's imported.
+    directory = mkdtemp(prefix="tournament-benchmark-")
+    database = os.path.join(directory, "benchmark.db")
+    os.environ["FLASK_SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + database
+    os.environ["FLASK_WTF_CSRF_ENABLED"] = "false"
+
+    try:
+        # Anything the app logs (at its LOG_LEVEL) goes to stderr, so it doesn't
+        # get mixed up with the report.
+        report = run(args)
+    finally:
+        if args.keep:
+            print("Database kept at {}.".format(database), file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    summarize(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        for regression in regressions:
+            print("Regression: {}".format(regression), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+def run(args):
+    from sqlalchemy import event
+    from tournament import app, db
+
+    app.config["TESTING"] = True
+    memory = not args.no_memory
+
+    with app.app_context():
+        queries = Counter()
+        event.listen(db.engine, "before_cursor_execute", queries)
+
+        lookups = fill(args, queries) \
+                  if args.history or args.history_file else None
+
+        results = []
+        for size in args.players:
+            rounds = args.rounds or min(max(ceil(log2(size)), 3), 15)
+            seed = "{}-{}".format(args.seed, size)
+            operations = play(app, size, rounds, args, random.Random(seed),
+                              queries, False)
+
+            if memory:
+                traced = play(app, size, rounds, args, random.Random(seed),
+                              queries, True)
+                for name, measurements in operations.items():
+                    for m, t in zip(measurements, traced.get(name, [])):
+                        m["peak_kb"] = t["peak_kb"]
+
+            results.append({"players": size, "rounds": rounds,
+                            "operations": operations})
+
+    return {"created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "engine": app.config.get("PAIRING_ENGINE", "matching"),
+            "seed": args.seed,
+            "drop_rate": args.drop_rate,
+            "memory": memory,
+            "history": lookups,
+            "results": results}
+
+
+def fill(args, queries):
+    """
+    Adds finished tournaments to the database (from an archive file, or made
+    up: 16 players and 4 rounds each, owned by 100 different users) through the
+    importer, then times some of the lookups that the app makes most often,
+    both with and without the indexes added by migration 3.
+    """
+    from sqlalchemy import select, func, or_, text
+    from tournament import db, migrations, archive
+    from tournament.models import Tournament, Match, Player, load_tournament
+    from tournament.standings import query_standings
+
+    rng = random.Random("{}-history".format(args.seed))
+
+    if args.history_file:
+        documents = archive.read(args.history_file)
+    else:
+        documents = history(args.history, rng)
+
+    ids = archive.load(documents, batch=500)
+    sample = [rng.choice(ids) for i in range(200)]
+
+    # The owner and first player of each tournament in the sample.
+    owners = dict(db.session.execute(
+        select(Tournament.id, Tournament.user_id)
+        .where(Tournament.id.in_(sample))).all())
+    firsts = dict(db.session.execute(
+        select(Player.tournament_id, func.min(Player.id))
+        .where(Player.tournament_id.in_(sample))
+        .group_by(Player.tournament_id)).all())
+    db.session.remove()
+
+    def lookup(function):
+        start = queries.count
+        began = perf_counter()
+        for id in sample:
+            function(id)
+            db.session.remove()
+        return {"seconds": round((perf_counter() - began) / len(sample), 6),
+                "queries": (queries.count - start) // len(sample)}
+
+    def measure():
+        return {
+            "tournament": lookup(load_tournament),
+            "active_players": lookup(lambda id:
+                Player.query.filter_by(tournament_id=id, active=True).all()),
+            "player_matches": lookup(lambda id:
+                Match.query.filter(or_(Match.seat_1_id == firsts.get(id),
+                                       Match.seat_2_id == firsts.get(id)))
+                           .all()),
+            "user_tournaments": lookup(lambda id:
+                Tournament.query.filter_by(user_id=owners[id]).all()),
+            "standings": lookup(lambda id:
+                query_standings(load_tournament(id))),
+        }
+
+    indexed = measure()
+
+    with db.engine.begin() as connection:
+        for index in ("ix_match_seat_1_id", "ix_match_seat_2_id",
+                      "ix_match_tournament_id", "ix_player_tournament_id_active",
+                      "ix_tournament_user_id"):
+            connection.execute(text("DROP INDEX {}".format(index)))
+
+    unindexed = measure()
+
+    with db.engine.begin() as connection:
+        migrations.add_indexes(connection)
+
+    return {"tournaments": len(ids), "file": args.history_file,
+            "lookups": {name: {"indexed": indexed[name],
+                               "unindexed": unindexed[name]}
+                        for name in indexed}}
+
+
+def play(app, size, rounds, args, rng, queries, memory):
+    """
+    Generates a tournament of the given size and plays it out, measuring each
+    step along the way. Returns a list of measurements for each operation.
+    """
+    from tournament import db
+    from tournament.models import User, Tournament, Player, load_tournament
+    from tournament.standings import compute_standings, query_standings, \
+        get_standings
+    from tournament.pairing import Entry, ENGINES
+    from tournament.rematches import rematches
+
+    engine = ENGINES[app.config.get("PAIRING_ENGINE", "matching")]
+    operations = {}
+
+    def record(name, round, result):
+        operations.setdefault(name, []).append(dict(round=round, **result))
+
+    def measure(function, repeat=1):
+        return timed(function, queries, memory, repeat)
+
+    if not db.session.get(User, "benchmark"):
+        db.session.add(User(id="benchmark", name="Benchmark", email=""))
+
+    tournament = Tournament(name="Benchmark ({} players)".format(size),
+                            user_id="benchmark", seed=rng.randrange(2 ** 31))
+    tournament.players = [Player(name="Player {}".format(i + 1))
+                          for i in range(size)]
+    db.session.add(tournament)
+    db.session.commit()
+    id = tournament.id
+    db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "benchmark"
+        session["_fresh"] = True
+        session["tournament"] = id
+
+    def get(url, **kwargs):
+        response = client.get(url, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError("GET {} failed ({}).".format(
+                               url, response.status_code))
+        return response
+
+    record("seat", 0, measure(lambda: get("/seat")))
+
+    for round_number in range(1, rounds + 1):
+        # Model level: pair the field as the pairing view would.
+        if round_number > 1:
+            tournament = load_tournament(id)
+            index = rematches(tournament, round_number)
+            entries = [Entry(s.player.id, s.points,
+                             index.opponents(s.player.id), s.byes)
+                       for s in get_standings(tournament) if s.player.active]
+            record("model.pair", round_number,
+                   measure(lambda: engine(entries)))
+            db.session.remove()
+
+        record("pair", round_number, measure(lambda: get("/pair")))
+
+        tournament = load_tournament(id)
+        round = tournament.current_round()
+        if len(round.matches) < 1 or all(not m.seat_2 for m in round.matches):
+            # Nobody is left to pair.
+            db.session.remove()
+            break
+
+        results = []
+        for match in round.matches:
+            if match.seat_2:
+                wins, losses, draws = rng.choice(RESULTS)
+                results.append({"match": match.id, "seat_1": wins,
+                                "seat_2": losses, "draws": draws})
+
+        drops = [p.id for p in tournament.active_players()
+                 if rng.random() < args.drop_rate]
+        db.session.remove()
+
+        record("report", round_number, measure(
+            lambda: client.post("/report_round", json={"results": results})))
+
+        for player in drops:
+            get("/drop?player={}".format(player))
+
+        record("standings", round_number,
+               measure(lambda: get("/standings"), args.repeat))
+
+        player = rng.randrange(size)
+        tournament = load_tournament(id)
+        player = tournament.players[player].id
+        db.session.remove()
+
+        record("details", round_number, measure(
+            lambda: get("/details?player={}".format(player)), args.repeat))
+
+        # Model level: what the views above do once they have the tournament.
+        def load():
+            db.session.remove()
+            return load_tournament(id)
+
+        record("model.load", round_number, measure(load, args.repeat))
+
+        tournament = load_tournament(id)
+        record("model.standings", round_number,
+               measure(lambda: compute_standings(tournament), args.repeat))
+        record("model.standings.sql", round_number,
+               measure(lambda: query_standings(tournament), args.repeat))
+
+        details = [p for p in tournament.players if p.id == player][0]
+        record("model.details", round_number, measure(
+            lambda: sorted(details.matches(),
+                           key=lambda m: m.round.round_number),
+            args.repeat))
+        db.session.remove()
+
+    return operations
+
+
+class Counter:
+    """
+    Counts the SQL statements executed (as a SQLAlchemy event listener).
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def history(count, rng, size=16, rounds=4):
+    """
+    Yields count made-up, finished tournaments, as archive documents.
+    """
+    from tournament.archive import FORMAT
+
+    for t in range(1, count + 1):
+        players = list(range(1, size + 1))
+        document = {"format": FORMAT, "id": t, "name": "History {}".format(t),
+                    "user_id": "user-{}".format(t % 100), "version": rounds,
+                    "players": [{"id": p, "name": "Player {}".format(p),
+                                 "active": rng.random() > 0.05, "table": 1,
+                                 "seat": 1} for p in players],
+                    "rounds": []}
+
+        for r in range(1, rounds + 1):
+            rng.shuffle(players)
+            matches = []
+            for table in range(size // 2):
+                wins, losses, draws = rng.choice(RESULTS)
+                matches.append({"table": table + 1,
+                                "seat_1": players[2 * table],
+                                "seat_2": players[2 * table + 1],
+                                "seat_1_wins": wins, "seat_2_wins": losses,
+                                "draws": draws})
+            document["rounds"].append({"round": r, "matches": matches})
+
+        yield document
+
+
+def timed(function, queries, memory, repeat=1):
+    """
+    Calls the function repeat times, and returns the fastest time, along with
+    the number of queries and the peak memory use of the last call.
+    """
+    times = []
+    for i in range(repeat):
+        if memory:
+            tracemalloc.start()
+        start = queries.count
+        began = perf_counter()
+        function()
+        times.append(perf_counter() - began)
+        count = queries.count - start
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    result = {"seconds": round(min(times), 6), "queries": count}
+    if memory:
+        result["peak_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def summarize(report):
+    """
+    Prints a summary of the report: the median and maximum time for each
+    operation, and the most queries that it used.
+    """
+    if report.get("history"):
+        history = report["history"]
+        print("Lookups among {} tournaments (seconds, with and without "
+              "indexes):".format(history["tournaments"]), file=sys.stderr)
+        for name, lookup in history["lookups"].items():
+            print("    {:<20}{:>10.5f}{:>10.5f}".format(
+                  name, lookup["indexed"]["seconds"],
+                  lookup["unindexed"]["seconds"]), file=sys.stderr)
+
+    line = "{:>8}  {:<20}{:>10}{:>10}{:>9}{:>12}"
+    print(line.format("Players", "Operation", "Median", "Max", "Queries",
+                      "Peak (KB)"), file=sys.stderr)
+
+    for result in report["results"]:
+        for name, measurements in result["operations"].items():
+            times = [m["seconds"] for m in measurements]
+            peak = max(m.get("peak_kb", 0) for m in measurements)
+            print(line.format(result["players"], name,
+                              "{:.4f}".format(median(times)),
+                              "{:.4f}".format(max(times)),
+                              max(m["queries"] for m in measurements),
+                              "{:.1f}".format(peak) if report["memory"]
+                              else "-"),
+                  file=sys.stderr)
+
+
+def compare(baseline, report, tolerance):
+    """
+    Returns a description of each operation which is slower (by more than the
+    tolerance) or uses more queries than it did in the baseline report.
+    """
+    previous = {(r["players"], name): measurements
+                for r in baseline["results"]
+                for name, measurements in r["operations"].items()}
+
+    regressions = []
+    for result in report["results"]:
+        for name, measurements in result["operations"].items():
+            before = previous.get((result["players"], name))
+            if not before:
+                continue
+
+            then = median(m["seconds"] for m in before)
+            now = median(m["seconds"] for m in measurements)
+            if now > then * (1 + tolerance):
+                regressions.append("{} with {} players took {:.4f}s (was "
+                                   "{:.4f}s).".format(name, result["players"],
+                                                      now, then))
+
+            then = max(m["queries"] for m in before)
+            now = max(m["queries"] for m in measurements)
+            if now > then:
+                regressions.append("{} with {} players used {} queries (was "
+                                   "{}).".format(name, result["players"], now,
+                                                 then))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# Written by Gem Newman. This work is licensed under a Creative Commons         
+# Attribution-NonCommercial-ShareAlike 3.0 Unported License.                    
+
+
+from argparse import ArgumentParser
+import sys
+
+from tournament import app, db, migrations, archive
+from tournament.models import Tournament, load_tournament
+
+
+def recount(args):
+    """
+    Rebuilds players' running totals from the match table.
+    """
+    ids = args.tournament or [t.id for t in Tournament.query.all()]
+
+    for id in ids:
+        tournament = load_tournament(id)
+        if not tournament:
+            print('Tournament {} does not exist.'.format(id))
+            continue
+
+        tournament.recount()
+        db.session.commit()
+        print('Recounted {} ({} players).'.format(tournament.name,
+                                                  len(tournament.players)))
+
+
+def delete(args):
+    """
+    Deletes tournaments in bulk, optionally archiving them to a file first.
+    """
+    if not (args.all or args.tournament or args.user or args.finished):
+        print('Specify which tournaments to delete (or --all).')
+        return
+
+    query = archive.select_tournaments(args.tournament, args.user,
+                                       args.finished)
+
+    def progress(done, total):
+        print('\r{} of {} tournaments {} ({:.0%}).'.format(
+              done, total, 'archived' if args.archive else 'deleted',
+              done / total), end='', file=sys.stderr, flush=True)
+
+    count = archive.clear(query, args.archive, args.batch, progress)
+    if count:
+        print(file=sys.stderr)
+    print('Deleted {} tournaments.'.format(count))
+
+
+def export(args):
+    """
+    Exports tournaments (with their players, rounds and matches) to a file.
+    """
+    query = archive.select_tournaments(args.tournament, args.user,
+                                       args.finished)
+
+    def progress(done, total):
+        print('\r{} of {} tournaments exported ({:.0%}).'.format(
+              done, total, done / total), end='', file=sys.stderr, flush=True)
+
+    count = archive.export(query, args.file, args.batch, progress)
+    if count:
+        print(file=sys.stderr)
+    print('Exported {} tournaments to {}.'.format(count, args.file))
+
+
+def load(args):
+    """
+    Imports tournaments from a file made by export (or delete --archive).
+    """
+    def progress(done):
+        print('\r{} tournaments imported.'.format(done), end='',
+              file=sys.stderr, flush=True)
+
+    ids = archive.load(archive.read(args.file), args.user, args.batch,
+                       progress)
+    if ids:
+        print(file=sys.stderr)
+        print('Imported {} tournaments (IDs {} to {}).'.format(
+              len(ids), ids[0], ids[-1]))
+    else:
+        print('No tournaments to import.')
+
+
+def schema(args):
+    """
+    Lists the schema migrations, and which of them the database has had. (The
+    schema is brought up to date whenever the app starts.)
+    """
+    with db.engine.connect() as connection:
+        version = migrations.current(connection)
+
+    for number, description, function in migrations.MIGRATIONS:
+        print('{} {:>3}  {}'.format('*' if number <= version else ' ', number,
+                                    description))
+
+
+if __name__ == '__main__':
+    description = "Maintenance commands for the Magic tournament program."
+    parser = ArgumentParser(description=description)
+    subparsers = parser.add_subparsers(title="commands", dest="command",
+                                       required=True)
+
+    command = subparsers.add_parser("recount", help="Rebuilds players' "
+                                    "running totals (points, games, etc.) "
+                                    "from match results.")
+    command.add_argument("-t", "--tournament", help="The ID of a tournament "
+                         "to recount. May be given more than once. Defaults "
+                         "to every tournament.", type=int, action="append")
+    command.set_defaults(function=recount)
+
+    command = subparsers.add_parser("delete", help="Deletes tournaments "
+                                    "(and their players, rounds and matches) "
+                                    "in bulk, a batch at a time.")
+    command.add_argument("-t", "--tournament", help="The ID of a tournament "
+                         "to delete. May be given more than once.", type=int,
+                         action="append")
+    command.add_argument("-u", "--user", help="Only deletes this user's "
+                         "tournaments.")
+    command.add_argument("-f", "--finished", help="Only deletes tournaments "
+                         "which have had every match reported.",
+                         action="store_true")
+    command.add_argument("--all", help="Deletes every tournament (unless "
+                         "limited by the options above).", action="store_true")
+    command.add_argument("-a", "--archive", help="Appends each tournament to "
+                         "this file (as JSON Lines, compressed if the name "
+                         "ends in .gz) before deleting it.")
+    command.add_argument("-b", "--batch", help="The number of tournaments to "
+                         "delete at a time. Defaults to 100.", type=int,
+                         default=100)
+    command.set_defaults(function=delete)
+
+    command = subparsers.add_parser("export", help="Exports tournaments "
+                                    "(and their players, rounds and matches) "
+                                    "to a file, a batch at a time.")
+    command.add_argument("file", help="The file to write (as JSON Lines, "
+                         "compressed if the name ends in .gz).")
+    command.add_argument("-t", "--tournament", help="The ID of a tournament "
+                         "to export. May be given more than once. Defaults "
+                         "to every tournament.", type=int, action="append")
+    command.add_argument("-u", "--user", help="Only exports this user's "
+                         "tournaments.")
+    command.add_argument("-f", "--finished", help="Only exports tournaments "
+                         "which have had every match reported.",
+                         action="store_true")
+    command.add_argument("-b", "--batch", help="The number of tournaments to "
+                         "export at a time. Defaults to 100.", type=int,
+                         default=100)
+    command.set_defaults(function=export)
+
+    command = subparsers.add_parser("import", help="Imports tournaments from "
+                                    "a file made by export or delete "
+                                    "--archive. Imported tournaments get new "
+                                    "IDs.")
+    command.add_argument("file", help="The file to read.")
+    command.add_argument("-u", "--user", help="Gives every imported "
+                         "tournament to this user, instead of its original "
+                         "owner.")
+    command.add_argument("-b", "--batch", help="The number of tournaments to "
+                         "import at a time. Defaults to 100.", type=int,
+                         default=100)
+    command.set_defaults(function=load)
+
+    command = subparsers.add_parser("schema", help="Lists the schema "
+                                    "migrations, marking those which have "
+                                    "been applied.")
+    command.set_defaults(function=schema)
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        args.function(args)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+# Written by Gem Newman. This work is licensed under a Creative Commons
+# Attribution-NonCommercial-ShareAlike 3.0 Unported License.
+
+
+from argparse import ArgumentParser
+from collections import namedtuple
+from tempfile import mkdtemp
+from time import perf_counter
+import os
+import shutil
+import sys
+
+
+# Replays tournaments from an archive file (made by manage.py export) to check
+# that they'd be seated and paired the same way again, and to time the pairing
+# engine on real tournaments rather than made-up ones. The first round is
+# reseated from the tournament's seed (if it has one: tournaments from before
+# seeds can't be reseated). Each later round is paired again from the results
+# of the rounds before it, with the players who actually played in it. Rounds
+# whose pairings were edited by hand won't match, of course.
+#
+# Everything happens in a temporary database, so the tournaments in the file
+# are never changed.
+
+Seat = namedtuple('Seat', ['id', 'table', 'seat'])
+
+
+def main():
+    description = "Replays the seating and pairing of archived tournaments " \
+                  "for the Magic tournament program."
+    parser = ArgumentParser(description=description)
+    parser.add_argument("file", help="The archive to replay (made by "
+                        "manage.py export).")
+    parser.add_argument("-e", "--engine", help="The pairing engine to use. "
+                        "Defaults to the PAIRING_ENGINE setting.")
+    parser.add_argument("-v", "--verbose", help="Lists the pairings of "
+                        "every round that differs.", action="store_true")
+    args = parser.parse_args()
+
+    # The app must be pointed at its own database before it's imported.
+    directory = mkdtemp(prefix="tournament-replay-")
+    os.environ["FLASK_SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + \
+        os.path.join(directory, "replay.db")
+
+    try:
+        differences = replay(args)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if differences:
+        sys.exit(1)
+
+
+def replay(args):
+    """
+    Replays every tournament in the file, printing a line for each round.
+    Returns the number of rounds that came out differently.
+    """
+    from tournament import app, archive
+    from tournament.pairing import ENGINES
+
+    engine = ENGINES[args.engine or app.config.get("PAIRING_ENGINE",
+                                                   "matching")]
+    rounds = differences = 0
+    seconds = 0.0
+
+    with app.app_context():
+        for document in archive.read(args.file):
+            for r in document["rounds"]:
+                actual = pairings(r)
+
+                if r["round"] > 1:
+                    replayed, elapsed = repair(document, r, engine)
+                    seconds += elapsed
+                elif document.get("seed") is not None:
+                    replayed, elapsed = reseat(app, document, actual), None
+                else:
+                    # Tournaments from before seeds were seated at random.
+                    print("Tournament {} ({}), round 1: not seeded".format(
+                          document["id"], document["name"]))
+                    continue
+
+                rounds += 1
+                same = replayed == actual
+                if not same:
+                    differences += 1
+
+                print("Tournament {} ({}), round {}: {}{}".format(
+                      document["id"], document["name"], r["round"],
+                      "same" if same else "DIFFERENT",
+                      "" if elapsed is None else
+                      " (paired in {:.3f}s)".format(elapsed)))
+
+                if args.verbose and not same:
+                    print("  Played:   {}".format(actual))
+                    print("  Replayed: {}".format(replayed))
+
+    print("{} of {} rounds replayed the same way ({:.3f}s pairing).".format(
+          rounds - differences, rounds, seconds), file=sys.stderr)
+    return differences
+
+
+def pairings(round):
+    """
+    Returns a round's (player, opponent) ID pairs, in table order.
+    """
+    return [(m["seat_1"], m["seat_2"]) for m in
+            sorted(round["matches"], key=lambda m: m["table"])]
+
+
+def reseat(app, document, actual):
+    """
+    Seats the players who played in the first round as the tournament's seed
+    would have seated them, and pairs them by their seats.
+    """
+    from tournament.models import Tournament
+    from tournament.seating import seat, pair_by_seat
+
+    players = sorted({id for pair in actual for id in pair if id is not None})
+
+    # Players are shuffled in ID order (as they're loaded) by the same
+    # generator that the app uses.
+    tournament = Tournament(id=document["id"], seed=document["seed"])
+    tournament.random("seating").shuffle(players)
+
+    seats = seat(players, app.config.get("IDEAL_TABLE", 8),
+                 app.config.get("MIN_TABLE"), app.config.get("MAX_TABLE"))
+    return [(player.id, opponent.id if opponent else None)
+            for player, opponent in pair_by_seat(
+                [Seat(*s) for s in seats])]
+
+
+def repair(document, round, engine):
+    """
+    Pairs the round again from the results of the rounds before it (imported
+    as a tournament of their own, with only the players who played in the
+    round still active). Returns the pairings, and how long they took.
+    """
+    from sqlalchemy import select
+    from tournament import db, archive
+    from tournament.models import Player, load_tournament
+    from tournament.standings import get_standings
+    from tournament.pairing import Entry
+
+    playing = {id for m in round["matches"]
+               for id in (m["seat_1"], m["seat_2"]) if id is not None}
+
+    earlier = dict(document,
+                   players=[dict(p, active=p["id"] in playing)
+                            for p in document["players"]],
+                   rounds=[r for r in document["rounds"]
+                           if r["round"] < round["round"]])
+    id, = archive.insert_tournaments([earlier])
+
+    # Players are inserted in the order that they're listed in, so their new
+    # IDs can be mapped back to the old ones.
+    new = db.session.scalars(select(Player.id)
+                             .where(Player.tournament_id == id)
+                             .order_by(Player.id)).all()
+    old = dict(zip(new, (p["id"] for p in document["players"])))
+
+    tournament = load_tournament(id)
+    entries = [Entry(s.player.id, s.points, set(s.opponents), s.byes)
+               for s in get_standings(tournament) if s.player.active]
+
+    began = perf_counter()
+    pairs = engine(entries)
+    elapsed = perf_counter() - began
+
+    db.session.remove()
+    return [(old[player], old.get(opponent)) for player, opponent in pairs], \
+        elapsed
+
+
+if __name__ == '__main__':
+    main()
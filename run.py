@@ -6,8 +6,6 @@
 
 from argparse import ArgumentParser
 
-from tournament import app
-
 
 if __name__ == '__main__':
     description = "Runs the Flask server for the Magic tournament program."
@@ -24,8 +22,26 @@ if __name__ == '__main__':
                         "on. This setting restarts the server whenever a "
                         "change in the source is detected.",
                         action="store_true")
+    parser.add_argument("-g", "--gevent", help="Serves requests with gevent "
+                        "instead of a thread each, so that many clients can "
+                        "follow live pairings and standings at once. "
+                        "(Requires gevent.)", action="store_true")
     args = parser.parse_args()
 
-    app.run(host="0.0.0.0" if args.public else "localhost", port=args.port,
-            use_debugger=args.debug, use_reloader=args.reload)
+    if args.gevent:
+        # Patching has to happen before anything else is imported.
+        from gevent import monkey
+        monkey.patch_all()
+
+    from tournament import app
+
+    if args.gevent:
+        from gevent.pywsgi import WSGIServer
+        app.debug = args.debug
+        WSGIServer(("0.0.0.0" if args.public else "localhost", args.port),
+                   app).serve_forever()
+    else:
+        app.run(host="0.0.0.0" if args.public else "localhost",
+                port=args.port, use_debugger=args.debug,
+                use_reloader=args.reload)
 
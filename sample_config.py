@@ -18,9 +18,108 @@ AUTH_URI = None
 LDAP_URI = 'ldap://YOUR.LDAP.URI'
 LDAP_SEARCH_BASE = 'ou=????,dc=????,dc=????'
 
+# Users are looked up over a pool of up to LDAP_POOL_SIZE connections, bound
+# anonymously unless LDAP_BIND_DN and LDAP_BIND_PASSWORD are set. Entries found
+# are cached (up to LDAP_CACHE_SIZE of them) for LDAP_CACHE_TTL seconds. Every
+# LDAP request gives up after LDAP_TIMEOUT seconds.
+LDAP_BIND_DN = None
+LDAP_BIND_PASSWORD = None
+LDAP_POOL_SIZE = 4
+LDAP_CACHE_SIZE = 1024
+LDAP_CACHE_TTL = 600
+LDAP_TIMEOUT = 5
+
+# Requests to AUTH_URI share a keep-alive session. They give up after
+# AUTH_TIMEOUT seconds, and are retried (AUTH_RETRIES times, backing off from
+# AUTH_BACKOFF seconds) if the server can't be reached or is unavailable. Users
+# who sign in are remembered (up to AUTH_CACHE_SIZE of them) for AUTH_CACHE_TTL
+# seconds, during which signing in again doesn't need the server.
+AUTH_TIMEOUT = 5
+AUTH_RETRIES = 2
+AUTH_BACKOFF = 0.25
+AUTH_CACHE_SIZE = 1024
+AUTH_CACHE_TTL = 60
+
+# Logged in users' details are cached (up to USER_CACHE_SIZE of them) for
+# USER_CACHE_TTL seconds, rather than looked up on every request.
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60
+
 # Admin
 ADMIN_USERS = ['USER.ID.HERE']
 
-# The number of people at an ideal drafting table.
+# The number of people at an ideal drafting table. Players are spread across
+# tables as evenly as possible (no two tables differ by more than one player).
+# Set MIN_TABLE and MAX_TABLE to keep tables within those sizes where possible.
 IDEAL_TABLE = 8
+MIN_TABLE = None
+MAX_TABLE = None
+
+
+# The number of tournaments shown on each page of the tournament list.
+LIST_PAGE_SIZE = 25
+
+# How players are paired after the first round: 'matching' (optimal pairings,
+# with at most one BYE) or 'greedy' (the old, faster algorithm).
+PAIRING_ENGINE = 'matching'
+
+# Set PAIRING_WORKERS to pair rounds of PAIRING_JOB_PLAYERS or more players in
+# that many background processes, so that /pair returns at once (and the judge
+# waits on a page that shows the pairings when they're ready). If the engine
+# takes longer than PAIRING_TIMEOUT seconds, the round is paired greedily.
+PAIRING_WORKERS = 0
+PAIRING_JOB_PLAYERS = 256
+PAIRING_TIMEOUT = 30
+
+# Standings are cached in-process by default (up to STANDINGS_CACHE_SIZE
+# tournament versions). To share them between processes, set STANDINGS_CACHE to
+# a Redis URL (e.g. 'redis://localhost:6379/0'), which requires redis.
+STANDINGS_CACHE = None
+STANDINGS_CACHE_SIZE = 128
+
+# Each tournament's index of who has played whom is kept in-process (for up to
+# REMATCH_CACHE_SIZE tournaments), and only the latest round is added to it.
+REMATCH_CACHE_SIZE = 32
+
+# Standings are computed in Python from each player's running totals
+# ('python'), or by the database in a couple of queries ('sql'). Both give
+# identical results.
+STANDINGS_BACKEND = 'python'
+
+# The JSON API (/api/v1/...) is read-only and public by default, so that
+# pairing and standings displays don't need to log in. Set this to only allow
+# logged in users to see their own tournaments.
+API_LOGIN_REQUIRED = False
+
+# Pairing and standings pages follow the tournament's event stream
+# (/api/v1/tournaments/<id>/events). Idle streams are sent a keepalive (and
+# check for changes made by other server processes) every EVENT_KEEPALIVE
+# seconds.
+EVENT_KEEPALIVE = 15
+
+# Messages are logged at LOG_LEVEL and above (e.g. 'DEBUG' to follow pairing
+# and reporting as it happens).
+LOG_LEVEL = 'WARNING'
+
+# Set INSTRUMENTATION to time each request and its database queries. The
+# figures are sent in X-Response-Time, X-DB-Queries and X-DB-Time headers (in
+# milliseconds), logged at DEBUG level, and totalled by endpoint at
+# /debug/metrics (for administrators). Queries slower than SLOW_QUERY seconds
+# are logged as warnings. If PROFILER is also set ('cprofile' or
+# 'pyinstrument', which requires pyinstrument), requests with a "profile"
+# parameter (e.g. /standings?profile) are profiled, and the results are saved
+# in PROFILE_DIR. When INSTRUMENTATION is off, none of this is even set up.
+INSTRUMENTATION = False
+SLOW_QUERY = 0.1
+PROFILER = None
+PROFILE_DIR = 'profiles'
 
+# Set METRICS to serve counters and histograms (of pairing, standings, report
+# and login times, failed logins and database queries, along with the number of
+# tournaments and rounds in progress) at /metrics, in Prometheus's text format.
+# If the server runs more than one process, set METRICS_DIR to a directory that
+# they share: each process writes its counts there every METRICS_FLUSH seconds,
+# and /metrics adds them all up. (Clear it when the server is restarted.)
+METRICS = False
+METRICS_DIR = None
+METRICS_FLUSH = 5
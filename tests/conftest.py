@@ -0,0 +1,202 @@
+import importlib
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+
+
+# The app reads its settings from a config module as soon as it's imported, so
+# the tests give it the sample configuration, pointed at a database of its own
+# (see the FLASK_ settings in tournament/__init__.py).
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+directory = tempfile.mkdtemp(prefix='tournament-tests-')
+os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = \
+    'sqlite:///' + os.path.join(directory, 'tests.db')
+os.environ['FLASK_WTF_CSRF_ENABLED'] = 'false'
+os.environ['FLASK_SECRET_KEY'] = '"tests"'
+sys.modules['config'] = importlib.import_module('sample_config')
+
+from flask import g, request_started
+from sqlalchemy import event, update
+
+from tournament import app as tournament_app, db as tournament_db
+from tournament.models import User, Tournament, Player, Round, Match, \
+    load_tournament
+
+
+def reset_g(sender, **extra):
+    # Requests share the tests' application context (and so g, where the
+    # signed in user is kept), where each would normally have its own.
+    for name in list(g):
+        g.pop(name)
+
+
+@pytest.fixture
+def app():
+    tournament_app.config['TESTING'] = True
+    request_started.connect(reset_g, tournament_app)
+    with tournament_app.app_context():
+        yield tournament_app
+        tournament_db.session.remove()
+    request_started.disconnect(reset_g, tournament_app)
+
+
+@pytest.fixture
+def db(app):
+    yield tournament_db
+
+    # Every test starts with an empty database.
+    tournament_db.session.remove()
+    for table in reversed(tournament_db.metadata.sorted_tables):
+        if table.name != 'schema_version':
+            tournament_db.session.execute(table.delete())
+    tournament_db.session.commit()
+
+
+class Queries:
+    """
+    Counts the SQL statements executed while it's listening.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def record(self, connection, cursor, statement, parameters, context,
+               executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self.record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self.record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def queries(db):
+    return Queries(db.engine)
+
+
+@pytest.fixture
+def client(app, db):
+    """
+    A test client, signed in as the user "organizer".
+    """
+    return sign_in(app, db, 'organizer')
+
+
+def sign_in(app, db, id):
+    """
+    Adds a user and returns a test client signed in as them.
+    """
+    db.session.add(User(id=id, name='User {}'.format(id), email=''))
+    db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = id
+        session['_fresh'] = True
+    return client
+
+
+def make_tournament(db, players=8, rounds=3, user_id='organizer',
+                    name='Test'):
+    """
+    Adds a tournament in which every round has been paired (in order) and
+    reported (seat 1 always winning 2-0), and returns its ID.
+    """
+    tournament = Tournament(name=name, user_id=user_id)
+    tournament.players = [Player(name='Player {}'.format(i + 1), table=1,
+                                 seat=i + 1) for i in range(players)]
+
+    # Matches take their tournament from their players, which need IDs first.
+    db.session.add(tournament)
+    db.session.flush()
+
+    with db.session.no_autoflush:
+        for r in range(1, rounds + 1):
+            round = Round(round_number=r)
+            # Each round pairs players a different distance apart.
+            order = tournament.players[r - 1:] + tournament.players[:r - 1]
+            for table in range(players // 2):
+                round.matches.append(Match(
+                    order[2 * table], order[2 * table + 1], table + 1,
+                    seat_1_wins=2, seat_2_wins=0, draws=0))
+            tournament.rounds.append(round)
+
+    tournament.recount()
+    db.session.commit()
+
+    id = tournament.id
+    db.session.remove()
+    return id
+
+
+# Results that a played match may have, draws included.
+RESULTS = [(2, 0, 0), (2, 1, 0), (0, 2, 0), (1, 2, 0), (1, 1, 1), (1, 1, 0),
+           (0, 1, 1), (0, 0, 3)]
+
+
+def report(client, match, result):
+    """
+    Reports a match's result through the view (as JSON).
+    """
+    seat_1, seat_2, draws = result
+    return client.post('/report_round', json={'results': [
+        {'match': match, 'seat_1': seat_1, 'seat_2': seat_2,
+         'draws': draws}]})
+
+
+def play_tournament(client, db, players=11, rounds=4, drops=1, seed=0,
+                    seat=False):
+    """
+    Plays a tournament through the views, as the client's user, and returns its
+    ID. Every round is paired, and every round but the last is reported (with
+    random results, BYEs and draws included). After each of the first drops
+    rounds, a random player drops. Players all sit at one table, unless seat
+    is given, in which case they're seated (by the tournament's seed) first.
+    """
+    rng = random.Random(seed)
+    id = make_tournament(db, players=players, rounds=0)
+    with client.session_transaction() as session:
+        session['tournament'] = id
+
+    if seat:
+        db.session.execute(update(Player).where(Player.tournament_id == id)
+                           .values(table=0, seat=0))
+        db.session.commit()
+        client.get('/seat')
+
+    for r in range(1, rounds + 1):
+        client.get('/pair')
+        tournament = load_tournament(id)
+        round = tournament.current_round()
+        assert round.round_number == r
+
+        if r < rounds:
+            results = [{'match': m.id, 'seat_1': result[0],
+                        'seat_2': result[1], 'draws': result[2]}
+                       for m in round.matches if m.seat_2
+                       for result in [rng.choice(RESULTS)]]
+            active = [p.id for p in tournament.active_players()]
+            db.session.remove()
+
+            response = client.post('/report_round', json={'results': results})
+            assert response.status_code == 200
+            if r <= drops:
+                client.get('/drop?player={}'.format(rng.choice(active)))
+
+        db.session.remove()
+
+    return id
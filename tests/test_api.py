@@ -0,0 +1,22 @@
+from conftest import make_tournament
+from tournament.models import Tournament
+
+
+def test_etags_are_not_shared_with_a_deleted_tournament(app, db):
+    client = app.test_client()
+    old = make_tournament(db, players=5, rounds=1)
+    url = '/api/v1/tournaments/{}/standings'.format(old)
+
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    db.session.delete(db.session.get(Tournament, old))
+    db.session.commit()
+    db.session.remove()
+
+    # The new tournament reuses the old one's ID, and its version.
+    assert make_tournament(db, players=6, rounds=1) == old
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()['standings']) == 6
@@ -0,0 +1,100 @@
+import pytest
+
+from conftest import make_tournament, play_tournament
+from tournament import archive
+from tournament.models import Tournament, TALLIES, load_tournament
+from tournament.standings import compute_standings
+
+
+def standings(db, id):
+    """
+    The tournament's standings, with players identified by name (since their
+    IDs change when they're imported), and its token.
+    """
+    db.session.remove()
+    tournament = load_tournament(id)
+    names = {p.id: p.name for p in tournament.players}
+
+    rows = [(s.player.name, s.player.active, s.points,
+             s.match_win_percentage, s.game_win_percentage,
+             s.op_match_win_percentage, s.op_game_win_percentage,
+             [names[o] for o in s.opponents], s.byes)
+            for s in compute_standings(tournament)]
+    tallies = {p.name: [getattr(p, column) for column in TALLIES]
+               for p in tournament.players}
+
+    # Imported players' running totals are worked out from the archive.
+    tournament.recount()
+    assert tallies == {p.name: [getattr(p, column) for column in TALLIES]
+                       for p in tournament.players}
+    db.session.rollback()
+
+    return rows, tournament.token
+
+
+def test_archived_tournaments_are_deleted_and_can_be_restored(client, db,
+                                                               tmp_path):
+    played = [play_tournament(client, db, players=n, rounds=3, seed=n)
+              for n in (7, 10)]
+    unpaired = make_tournament(db, players=4, rounds=0)
+    before = [standings(db, id) for id in played]
+
+    path = str(tmp_path / 'archive.jsonl')
+    query = archive.select_tournaments(played)
+    assert archive.clear(query, path, batch=1) == 2
+    assert db.session.get(Tournament, played[0]) is None
+    assert db.session.get(Tournament, played[1]) is None
+    assert db.session.get(Tournament, unpaired) is not None
+
+    ids = archive.load(archive.read(path))
+    assert len(ids) == 2
+    for id, (rows, token) in zip(ids, before):
+        restored, new_token = standings(db, id)
+        assert restored == rows
+        assert new_token != token
+
+
+def test_only_finished_tournaments_are_selected_as_finished(client, db):
+    # Its last round is unreported.
+    playing = play_tournament(client, db, players=6, rounds=2)
+    unpaired = make_tournament(db, players=4, rounds=0)
+    finished = make_tournament(db, players=4, rounds=2)
+
+    query = archive.select_tournaments(finished=True)
+    assert db.session.execute(query).scalars().all() == [finished]
+
+    assert archive.clear(query) == 1
+    assert db.session.execute(archive.select_tournaments()).scalars().all() \
+        == [playing, unpaired]
+
+
+def test_exported_tournaments_import_identically(client, db, tmp_path):
+    ids = [play_tournament(client, db, players=n, rounds=4, seed=n)
+           for n in (9, 12)]
+    before = [standings(db, id) for id in ids]
+
+    # Compressed, since the name ends in .gz.
+    path = str(tmp_path / 'export.jsonl.gz')
+    assert archive.export(archive.select_tournaments(), path, batch=1) == 2
+
+    copies = archive.load(archive.read(path), user_id='someone')
+    assert set(copies).isdisjoint(ids)
+
+    for id, copy, (rows, token) in zip(ids, copies, before):
+        assert standings(db, id) == (rows, token)
+
+        imported, new_token = standings(db, copy)
+        assert imported == rows
+        assert new_token != token
+        assert db.session.get(Tournament, copy).user_id == 'someone'
+
+
+def test_other_files_are_not_imported(tmp_path):
+    path = tmp_path / 'other.jsonl'
+    path.write_text('{"format": 1, "name": "Fine", "user_id": null, '
+                    '"players": [], "rounds": []}\n\n{"name": "Unknown"}\n')
+
+    documents = archive.read(str(path))
+    assert next(documents)['name'] == 'Fine'
+    with pytest.raises(ValueError, match='Line 3'):
+        next(documents)
@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import tournament.authenticate as authenticate
+
+
+class AuthServer(ThreadingHTTPServer):
+    """
+    A stand-in for AUTH_URI, which signs in anyone whose password is
+    "password". It records the usernames it's sent, and can be told to be
+    unavailable for a number of requests, or to be slow to answer.
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), AuthHandler)
+        self.requests = []
+        self.unavailable = 0
+        self.delay = 0
+
+    @property
+    def uri(self):
+        return 'http://127.0.0.1:{}/'.format(self.server_port)
+
+
+class AuthHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server.requests.append(body['id'])
+        time.sleep(server.delay)
+
+        if server.unavailable:
+            server.unavailable -= 1
+            status, text = 503, 'Unavailable.'
+        elif body['password'] == 'password':
+            status, text = 200, json.dumps({
+                'id': body['id'], 'name': body['id'].title(),
+                'email': body['id'] + '@example.com'})
+        else:
+            status, text = 401, 'Invalid username or password.'
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text.encode())
+
+
+@pytest.fixture
+def server(app, monkeypatch):
+    server = AuthServer()
+    threading.Thread(target=server.serve_forever, args=(0.05,),
+                     daemon=True).start()
+
+    monkeypatch.setitem(app.config, 'AUTH_METHOD', 'auth')
+    monkeypatch.setitem(app.config, 'AUTH_URI', server.uri)
+    monkeypatch.setitem(app.config, 'AUTH_TIMEOUT', 0.5)
+    monkeypatch.setitem(app.config, 'AUTH_RETRIES', 2)
+    monkeypatch.setitem(app.config, 'AUTH_BACKOFF', 0)
+    authenticate.service.clear()
+
+    yield server
+    authenticate.service.clear()
+    server.shutdown()
+    server.server_close()
+
+
+def test_users_are_signed_in_and_remembered(server):
+    user, message = authenticate.authenticate('alice', 'password')
+    assert (user.id, user.name, user.email) == \
+        ('alice', 'Alice', 'alice@example.com')
+
+    user, message = authenticate.authenticate('alice', 'wrong')
+    assert user is None and message == 'Invalid username or password.'
+
+    authenticate.authenticate('alice', 'password')
+    assert server.requests == ['alice', 'alice']
+
+
+def test_unavailable_servers_are_retried(server):
+    server.unavailable = 2
+    user, message = authenticate.authenticate('alice', 'password')
+    assert user.id == 'alice'
+    assert server.requests == ['alice'] * 3
+
+    server.unavailable = 3
+    user, message = authenticate.authenticate('bob', 'password')
+    assert user is None and message == 'Unavailable.'
+    assert server.requests == ['alice'] * 3 + ['bob'] * 3
+
+
+def test_slow_servers_time_out_without_retrying(server):
+    server.delay = 1
+    start = time.monotonic()
+    user, message = authenticate.authenticate('alice', 'password')
+
+    assert time.monotonic() - start < 1
+    assert user is None
+    assert message == 'The authentication server could not be reached.'
+    assert server.requests == ['alice']
+
+
+def test_passwords_are_not_kept(server):
+    for username, password in (('alice', 'password'), ('bob', 'password')):
+        authenticate.authenticate(username, password)
+
+    keys = list(authenticate.service['users'].values)
+    assert len(keys) == 2
+    assert not any('password' in key for key in keys)
+    assert authenticate.credentials('alice', 'password') in keys
@@ -0,0 +1,131 @@
+import pytest
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+
+from conftest import make_tournament, report
+from tournament import metrics, views
+from tournament.models import Tournament, Round, Match, load_tournament
+
+
+@pytest.fixture
+def tournament(client, db):
+    id = make_tournament(db, players=8, rounds=1)
+
+    # The round is left unreported.
+    db.session.execute(update(Match).values(seat_1_wins=0, seat_2_wins=0,
+                                            draws=0))
+    load_tournament(id).recount()
+    db.session.commit()
+    db.session.remove()
+
+    with client.session_transaction() as session:
+        session['tournament'] = id
+    return id
+
+
+def report_meanwhile(db, monkeypatch, *reports):
+    """
+    Makes each of the next reports (of a match ID and result) in the meantime,
+    as another request would, just before this request claims the tournament.
+    """
+    touch = Tournament.touch
+    pending = list(reports)
+
+    def racing_touch(self):
+        if pending:
+            match, result = pending.pop(0)
+            with db.engine.begin() as connection:
+                connection.execute(
+                    update(Match).where(Match.id == match)
+                    .values(seat_1_wins=result[0], seat_2_wins=result[1],
+                            draws=result[2]))
+                connection.execute(
+                    update(Tournament).where(Tournament.id == self.id)
+                    .values(version=Tournament.version + 1))
+        touch(self)
+
+    monkeypatch.setattr(Tournament, 'touch', racing_touch)
+
+
+def matches(db, id):
+    db.session.remove()
+    tournament = load_tournament(id)
+    return tournament, [(m.seat_1_wins, m.seat_2_wins, m.draws)
+                        for m in tournament.current_round().matches]
+
+
+def test_reports_of_other_matches_are_not_conflicts(client, db, monkeypatch,
+                                                    tournament):
+    first, second, third = [m.id for m in matches(db, tournament)[0]
+                            .current_round().matches][:3]
+    db.session.remove()
+
+    report_meanwhile(db, monkeypatch, (second, (0, 2, 0)),
+                     (third, (1, 1, 1)))
+    response = report(client, first, (2, 1, 0))
+    assert response.get_json() == {'reported': 1}
+
+    loaded, results = matches(db, tournament)
+    assert results[:3] == [(2, 1, 0), (0, 2, 0), (1, 1, 1)]
+    assert loaded.version == 3
+
+    # The result was only counted once, in the players' running totals.
+    # (The others were made behind the app's back, so aren't counted.)
+    assert sum(p.match_count for p in loaded.players) == 2
+
+
+def test_reports_of_the_same_match_conflict(client, db, monkeypatch,
+                                            tournament):
+    first = matches(db, tournament)[0].current_round().matches[0].id
+    db.session.remove()
+
+    report_meanwhile(db, monkeypatch, (first, (0, 2, 0)))
+    response = report(client, first, (2, 1, 0))
+    assert response.status_code == 409
+    assert matches(db, tournament)[1][0] == (0, 2, 0)
+
+
+def test_identical_reports_of_the_same_match_agree(client, db, monkeypatch,
+                                                   tournament):
+    first = matches(db, tournament)[0].current_round().matches[0].id
+    db.session.remove()
+
+    report_meanwhile(db, monkeypatch, (first, (2, 1, 0)))
+    response = report(client, first, (2, 1, 0))
+    assert response.get_json() == {'reported': 0}
+    assert matches(db, tournament)[1][0] == (2, 1, 0)
+
+
+def test_adding_a_round_twice_is_a_conflict(client, db, monkeypatch,
+                                            tournament):
+    # The round is added in the meantime, without the tournament's version
+    # changing, so only the unique constraint on round numbers catches it.
+    def racing_touch(self):
+        with db.engine.begin() as connection:
+            connection.execute(insert(Round).values(tournament_id=self.id,
+                                                    round_number=2))
+
+    for match in matches(db, tournament)[0].current_round().matches:
+        report(client, match.id, (2, 0, 0))
+    db.session.remove()
+
+    monkeypatch.setattr(Tournament, 'touch', racing_touch)
+    conflicts = metrics.conflicts.snapshot().get((), [0])[0]
+
+    response = client.get('/pair')
+    assert response.status_code == 302
+    assert response.location.endswith('/main')
+    assert metrics.conflicts.snapshot()[()][0] == conflicts + 1
+
+
+def test_other_integrity_errors_are_not_conflicts(client, db, monkeypatch,
+                                                  tournament):
+    def fail(tournament):
+        raise IntegrityError('INSERT', {}, Exception('Something else.'))
+
+    monkeypatch.setattr(views, 'get_standings', fail)
+    conflicts = metrics.conflicts.snapshot().get((), [0])[0]
+
+    with pytest.raises(IntegrityError):
+        client.get('/standings')
+    assert metrics.conflicts.snapshot().get((), [0])[0] == conflicts
@@ -0,0 +1,52 @@
+import json
+
+from conftest import make_tournament, play_tournament
+from tournament.events import broker
+from tournament.models import load_tournament
+
+
+def events(queue):
+    received = []
+    while not queue.empty():
+        text = queue.get_nowait().text
+        name = text.split('event: ')[1].split('\n')[0]
+        data = json.loads(text.split('data: ')[1])
+        received.append((name, data))
+    return received
+
+
+def test_swaps_send_only_the_changed_pairings(client, db):
+    id = play_tournament(client, db, players=8, rounds=2)
+    matches = load_tournament(id).current_round().matches
+    player, opponent = matches[0].seat_1, matches[1].seat_1
+    db.session.remove()
+
+    queue = broker.subscribe(id)
+    try:
+        client.get('/edit_pairings?player={}&opponent={}'.format(player.id,
+                                                                 opponent.id))
+        [(name, data)] = events(queue)
+    finally:
+        broker.unsubscribe(id, queue)
+
+    assert name == 'pairings'
+    assert data['round'] == 2 and data['removed'] == []
+    assert [m['table'] for m in data['pairings']] == [1, 2]
+    assert data['pairings'][0]['seat_1']['id'] == player.id
+    assert data['pairings'][0]['seat_2']['id'] == opponent.id
+
+
+def test_live_tables_identify_their_rows(client, db):
+    id = make_tournament(db, players=4, rounds=1)
+    with client.session_transaction() as session:
+        session['tournament'] = id
+    tournament = load_tournament(id)
+
+    page = client.get('/view_pairings').get_data(as_text=True)
+    assert 'data-round="1"' in page
+    for match in tournament.current_round().matches:
+        assert 'data-table="{}"'.format(match.table_number) in page
+
+    page = client.get('/standings').get_data(as_text=True)
+    for player in tournament.players:
+        assert 'data-player="{}"'.format(player.id) in page
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from conftest import make_tournament
+from tournament import jobs, views
+from tournament.models import load_tournament
+from tournament.pairing import greedy
+
+
+# Engines run in forked worker processes, so they're defined at module level.
+
+def slow(entries):
+    time.sleep(2)
+    return greedy(entries)
+
+
+def broken(entries):
+    raise ValueError("The engine is broken.")
+
+
+@pytest.fixture
+def background(app, monkeypatch):
+    """
+    Pairs every round in a background job, with a short timeout.
+    """
+    monkeypatch.setitem(app.config, 'PAIRING_WORKERS', 1)
+    monkeypatch.setitem(app.config, 'PAIRING_JOB_PLAYERS', 2)
+    monkeypatch.setitem(app.config, 'PAIRING_TIMEOUT', 0.25)
+    monkeypatch.setitem(views.ENGINES, 'slow', slow)
+    monkeypatch.setitem(views.ENGINES, 'broken', broken)
+    yield
+
+    executor = jobs.pool.pop('executor', None)
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+    jobs.jobs.clear()
+
+
+def wait(id):
+    job = jobs.find(id)
+    deadline = time.monotonic() + 10
+    while job.state == 'running' and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return job
+
+
+@pytest.mark.parametrize('engine', ['slow', 'broken'])
+def test_jobs_fall_back_to_greedy_pairing(app, client, db, monkeypatch,
+                                          background, engine):
+    # Round 1 is reported, so round 2 is paired by the engine.
+    id = make_tournament(db, players=12, rounds=1)
+    with client.session_transaction() as session:
+        session['tournament'] = id
+    monkeypatch.setitem(app.config, 'PAIRING_ENGINE', engine)
+
+    started = time.monotonic()
+    response = client.get('/pair')
+    assert response.location.endswith('/pairing')
+    assert time.monotonic() - started < 1
+
+    job = wait(id)
+    assert (job.state, job.engine, job.round_number) == ('done', 'greedy', 2)
+
+    db.session.remove()
+    tournament = load_tournament(id)
+    first, second = tournament.rounds
+    played = {frozenset((m.seat_1_id, m.seat_2_id)) for m in first.matches}
+    assert len(second.matches) == 6
+    assert all(m.seat_2 for m in second.matches)
+    assert not played & {frozenset((m.seat_1_id, m.seat_2_id))
+                         for m in second.matches}
+
+
+def test_jobs_use_the_engine_when_it_finishes_in_time(client, db, background):
+    id = make_tournament(db, players=12, rounds=1)
+    with client.session_transaction() as session:
+        session['tournament'] = id
+
+    assert client.get('/pair').location.endswith('/pairing')
+    job = wait(id)
+    assert (job.state, job.engine) == ('done', 'pair_round')
+
+    db.session.remove()
+    assert load_tournament(id).current_round().round_number == 2
+
+
+def test_small_rounds_are_paired_in_the_request(app, client, db, monkeypatch,
+                                                background):
+    monkeypatch.setitem(app.config, 'PAIRING_JOB_PLAYERS', 13)
+    id = make_tournament(db, players=12, rounds=1)
+    with client.session_transaction() as session:
+        session['tournament'] = id
+
+    assert client.get('/pair').location.endswith('/view_pairings')
+    assert jobs.find(id) is None
+
+    db.session.remove()
+    assert load_tournament(id).current_round().round_number == 2
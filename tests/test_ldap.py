@@ -0,0 +1,131 @@
+import pytest
+from ldap3 import Connection, MOCK_SYNC
+from ldap3.utils.conv import escape_filter_chars
+
+import tournament.authenticate as authenticate
+import tournament.cache
+
+
+BASE = 'ou=people,dc=example,dc=com'
+
+
+class Directory:
+    """
+    A fake LDAP server (ldap3's mock strategy), which records the connections
+    made to it and the searches made over them.
+    """
+
+    def __init__(self):
+        self.connections = []
+        self.searches = []
+
+    def connection(self, server, **options):
+        directory = self
+
+        class FakeConnection(Connection):
+            def search(self, search_base, search_filter, *args, **kwargs):
+                directory.searches.append(search_filter)
+                return super().search(search_base, search_filter, *args,
+                                      **kwargs)
+
+        # The mock strategy wants passwords as text, and times nothing out.
+        if isinstance(options.get('password'), bytes):
+            options['password'] = options['password'].decode('iso8859-1')
+        options.pop('receive_timeout', None)
+        options['client_strategy'] = MOCK_SYNC
+        auto_bind = options.pop('auto_bind', False)
+
+        connection = FakeConnection(server, **options)
+        self.connections.append(options.get('user'))
+        if auto_bind:
+            assert connection.bind()
+        return connection
+
+    def add(self, connection, uid, password):
+        dn = 'uid={},{}'.format(escape_filter_chars(uid), BASE)
+        connection.strategy.add_entry(dn, {
+            'uid': uid, 'cn': uid.title(), 'mail': uid + '@example.com',
+            'userPassword': password, 'objectClass': 'person'})
+
+
+@pytest.fixture
+def directory(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'AUTH_METHOD', 'ldap')
+    monkeypatch.setitem(app.config, 'LDAP_URI', 'ldap://directory.test')
+    monkeypatch.setitem(app.config, 'LDAP_SEARCH_BASE', BASE)
+    monkeypatch.setitem(app.config, 'LDAP_BIND_DN', 'uid=service,' + BASE)
+    monkeypatch.setitem(app.config, 'LDAP_BIND_PASSWORD', 'service')
+    monkeypatch.setitem(app.config, 'LDAP_CACHE_TTL', 60)
+
+    fake = Directory()
+    monkeypatch.setattr(authenticate, 'Connection', fake.connection)
+    authenticate.directory.clear()
+
+    # Entries are kept by the (mock) server, so any connection to it can add
+    # them.
+    seed = Connection(authenticate.connect_directory()['server'],
+                      client_strategy=MOCK_SYNC)
+    for uid, password in (('service', 'service'), ('alice', 'secret'),
+                          ('bob', 'hunter2'), ('*)(uid=*', 'star'),
+                          ('back\\slash', 'slash')):
+        fake.add(seed, uid, password)
+
+    yield fake
+    authenticate.directory.clear()
+
+
+def test_users_are_looked_up_over_one_connection(directory):
+    for username, password in (('alice', 'secret'), ('bob', 'hunter2'),
+                               ('alice', 'wrong'), ('nobody', 'secret')):
+        authenticate.authenticate(username, password)
+
+    # One (pooled) service connection, plus one to check each password given
+    # for a user who exists.
+    service = 'uid=service,' + BASE
+    assert directory.connections.count(service) == 1
+    assert len(directory.connections) == 4
+
+
+def test_users_are_signed_in_only_with_their_passwords(directory):
+    user, message = authenticate.authenticate('alice', 'secret')
+    assert (user.id, user.name, user.email) == \
+        ('alice', 'Alice', 'alice@example.com')
+
+    for password in ('wrong', ''):
+        user, message = authenticate.authenticate('alice', password)
+        assert user is None and message == "Invalid username or password."
+
+
+def test_entries_are_cached_until_they_expire(directory, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tournament.cache, 'monotonic', lambda: now[0])
+
+    for i in range(3):
+        authenticate.authenticate('alice', 'secret')
+    assert len(directory.searches) == 1
+
+    now[0] += 59
+    authenticate.authenticate('alice', 'secret')
+    assert len(directory.searches) == 1
+
+    now[0] += 2
+    authenticate.authenticate('alice', 'secret')
+    assert len(directory.searches) == 2
+
+
+@pytest.mark.parametrize('username, password', [
+    ('*', 'secret'), ('*', 'star'), ('alice)(uid=*', 'secret'),
+    ('*)(uid=*', 'secret'), ('back\\2a', 'slash')])
+def test_filter_characters_in_usernames_are_escaped(directory, username,
+                                                    password):
+    user, message = authenticate.authenticate(username, password)
+    assert user is None
+    assert directory.searches == \
+        ['(uid={})'.format(escape_filter_chars(username))]
+
+
+def test_users_with_filter_characters_in_their_names_can_sign_in(directory):
+    for username, password in (('*)(uid=*', 'star'),
+                               ('back\\slash', 'slash')):
+        user, message = authenticate.authenticate(username, password)
+        assert user.id == username
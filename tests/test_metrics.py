@@ -0,0 +1,23 @@
+from conftest import make_tournament
+from tournament import metrics
+
+
+def observations(histogram):
+    return sum(sum(value[:-1]) for value in histogram.snapshot().values())
+
+
+def test_seating_and_pairing_are_timed_separately(client, db):
+    id = make_tournament(db, players=8, rounds=0)
+    with client.session_transaction() as session:
+        session['tournament'] = id
+
+    seated = observations(metrics.seating_seconds)
+    paired = observations(metrics.pairing_seconds)
+
+    client.get('/seat')
+    assert observations(metrics.seating_seconds) == seated + 1
+    assert observations(metrics.pairing_seconds) == paired
+
+    client.get('/pair')
+    assert observations(metrics.seating_seconds) == seated + 1
+    assert observations(metrics.pairing_seconds) == paired + 1
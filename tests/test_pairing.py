@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from tournament.pairing import Entry, pair_round, greedy, ENGINES
+
+
+def entries(points, played=(), byes=()):
+    """
+    Entries for players 1, 2, 3... in rank order, with the given points, who
+    have played the given pairs, and (for those given) had a BYE.
+    """
+    opponents = {i: set() for i in range(1, len(points) + 1)}
+    for a, b in played:
+        opponents[a].add(b)
+        opponents[b].add(a)
+    return [Entry(i, p, opponents[i], 1 if i in byes else 0)
+            for i, p in enumerate(points, 1)]
+
+
+def check(tables, field):
+    """
+    Checks that everyone is paired exactly once, without rematches, and
+    returns the players given BYEs.
+    """
+    seen = [p for table in tables for p in table if p is not None]
+    assert sorted(seen) == sorted(e.id for e in field)
+
+    opponents = {e.id: e.opponents for e in field}
+    for player, opponent in tables:
+        assert opponent not in opponents[player]
+    return [player for player, opponent in tables if opponent is None]
+
+
+@pytest.mark.parametrize('engine', sorted(ENGINES))
+def test_odd_fields_give_one_bye_to_the_lowest_player_without_one(engine):
+    field = entries([9, 6, 6, 3, 3, 0, 0])
+    assert check(ENGINES[engine](field), field) == [7]
+
+    field = entries([9, 6, 6, 3, 3, 0, 0], byes=[7])
+    assert check(pair_round(field), field) == [6]
+
+    field = entries([9, 6, 6, 3, 3, 0, 0], byes=[6, 7])
+    assert check(pair_round(field), field) == [5]
+
+
+def test_byes_are_seated_last():
+    field = entries([3, 3, 0])
+    assert pair_round(field) == [(1, 2), (3, None)]
+    assert pair_round([]) == []
+
+
+def test_there_are_no_rematches():
+    # A Swiss event, in which each round is paired from the last's results.
+    rng = random.Random(1)
+    field = entries([0] * 21)
+
+    for round in range(6):
+        tables = pair_round(field)
+        byes = check(tables, field)
+        assert len(byes) == 1
+        assert not any(e.byes for e in field if e.id in byes)
+
+        players = {e.id: e for e in field}
+        for player, opponent in tables:
+            if opponent is None:
+                players[player] = players[player]._replace(
+                    points=players[player].points + 3,
+                    byes=players[player].byes + 1)
+                continue
+
+            players[player].opponents.add(opponent)
+            players[opponent].opponents.add(player)
+            winner = rng.choice((player, opponent))
+            players[winner] = players[winner]._replace(
+                points=players[winner].points + 3)
+
+        field = sorted(players.values(), key=lambda e: (-e.points, e.id))
+
+
+def test_the_window_widens_until_everyone_is_paired():
+    # Within a window of 1, player 1's only candidate is 2, and 4's is 3. Both
+    # are rematches, so players 1 and 4 can only be paired further apart.
+    field = entries([0, 0, 0, 0], played=[(1, 2), (3, 4)])
+    tables = pair_round(field, window=1)
+    assert check(tables, field) == []
+    assert len(tables) == 2
+
+
+def test_the_closest_pairing_overall_is_found_where_greedy_fails():
+    # Greedy pairing takes 1 and 2 together, leaving 3 and 4 (who have already
+    # played) with a BYE each. Of the two complete pairings, 1-3 and 2-4
+    # (with point differences of 3 and 3) is closer than 1-4 and 2-3 (6 and
+    # 0), since the differences are squared.
+    field = entries([6, 3, 3, 0], played=[(3, 4)])
+    assert greedy(field) == [(1, 2), (3, None), (4, None)]
+    assert pair_round(field) == [(1, 3), (2, 4)]
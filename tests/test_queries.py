@@ -0,0 +1,95 @@
+import pytest
+
+from conftest import make_tournament
+from tournament.models import load_tournament, tournament_page
+from tournament.standings import compute_standings
+
+
+# Loading a tournament, and every page built from one, takes a fixed number of
+# queries however many players, rounds and matches it has.
+
+
+def test_load_tournament_uses_a_fixed_number_of_queries(db, queries):
+    small = make_tournament(db, players=8, rounds=2)
+    large = make_tournament(db, players=64, rounds=5)
+
+    counts = []
+    for id in (small, large):
+        with queries:
+            load_tournament(id)
+        counts.append(queries.count)
+        db.session.remove()
+
+    # The tournament, its players (and each side of their matches), and its
+    # rounds (and their matches).
+    assert counts == [6, 6]
+
+
+def test_loaded_tournament_needs_no_more_queries(db, queries):
+    id = make_tournament(db, players=16, rounds=4)
+    tournament = load_tournament(id)
+
+    with queries:
+        compute_standings(tournament)
+        for player in tournament.players:
+            player.matches()
+            player.opponents()
+            player.opponent()
+        for round in tournament.rounds:
+            for match in round.matches:
+                match.seat_1, match.seat_2, match.round.tournament
+        tournament.current_round().reporting_complete()
+        tournament.seated()
+        tournament.paired()
+
+    assert queries.statements == []
+
+
+def test_tournament_page_is_one_query(db, queries):
+    for i in range(30):
+        make_tournament(db, players=4, rounds=1, name='Event {}'.format(i))
+
+    with queries:
+        rows, older, newer = tournament_page(size=10)
+    assert queries.count == 1
+    assert len(rows) == 10 and older is not None and newer is None
+
+    with queries:
+        rows, older, newer = tournament_page(before=older, size=10)
+    assert queries.count == 1
+    assert len(rows) == 10 and newer is not None
+
+    with queries:
+        rows, older, newer = tournament_page(search='event 2', size=20)
+    assert queries.count == 1
+    assert {r.name for r in rows} == {'Event 2'} | \
+        {'Event {}'.format(i) for i in range(20, 30)}
+
+
+# Seating is only shown until the first round is paired.
+@pytest.mark.parametrize('url, rounds', [
+    ('/view_seating', 0), ('/view_pairings', 3), ('/report', 3),
+    ('/standings', 3), ('/stats', 3), ('/details?player=', 3), ('/list', 3),
+    ('/main', 3)])
+def test_pages_use_a_fixed_number_of_queries(client, db, queries, url,
+                                             rounds):
+    # The signed in user is looked up once, then cached (see load_user).
+    client.get('/list')
+
+    counts = []
+    for players in (8, 64):
+        id = make_tournament(db, players=players, rounds=rounds)
+        with client.session_transaction() as session:
+            session['tournament'] = id
+        if url.endswith('='):
+            url += str(load_tournament(id).players[0].id)
+            db.session.remove()
+
+        with queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        counts.append(queries.count)
+        url = url.rstrip('0123456789')
+
+    assert counts[0] == counts[1]
+    assert counts[0] <= 8
@@ -0,0 +1,36 @@
+from conftest import make_tournament
+from tournament.models import load_tournament
+from tournament.rematches import rematches, indexes
+
+
+def test_indexes_are_not_shared_with_a_deleted_tournament(client, db):
+    old = make_tournament(db, players=4, rounds=1)
+
+    # The first round pairs 1 with 3 and 2 with 4.
+    tournament = load_tournament(old)
+    first, second = tournament.rounds[0].matches
+    first.seat_2, second.seat_1 = second.seat_1, first.seat_2
+    db.session.commit()
+
+    players = [p.id for p in tournament.players]
+    key = tournament.key
+    assert rematches(tournament, 2).played(players[0], players[2])
+    assert indexes.get(key) is not None
+    db.session.remove()
+
+    client.get('/delete?id={}'.format(old))
+    assert indexes.get(key) is None
+
+    # The new tournament reuses the old one's IDs, for its players too. Its
+    # first round pairs 1 with 2 and 3 with 4, and its second, 2 with 3 and 4
+    # with 1.
+    new = make_tournament(db, players=4, rounds=2)
+    tournament = load_tournament(new)
+    assert new == old
+    assert [p.id for p in tournament.players] == players
+
+    index = rematches(tournament, 3)
+    a, b, c, d = players
+    assert all(index.played(*pair) for pair in ((a, b), (c, d), (b, c),
+                                                (d, a)))
+    assert not index.played(a, c) and not index.played(b, d)
@@ -0,0 +1,39 @@
+from argparse import Namespace
+
+from conftest import play_tournament
+from tournament import archive
+from tournament.models import load_tournament
+
+import replay
+
+
+def export(db, ids, path):
+    db.session.remove()
+    archive.export(archive.select_tournaments(ids), str(path))
+    return Namespace(file=str(path), engine=None, verbose=True)
+
+
+def test_seeded_tournaments_replay_the_same_way(client, db, tmp_path, capsys):
+    ids = [play_tournament(client, db, players=n, rounds=4, drops=2, seed=n,
+                           seat=True)
+           for n in (13, 20)]
+    # The first round is reseated from the seed, and the rest repaired.
+    assert replay.replay(export(db, ids, tmp_path / 'played.jsonl')) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 8
+    assert all(': same' in line for line in lines)
+    assert lines[0].endswith('round 1: same')
+
+
+def test_pairings_edited_by_hand_replay_differently(client, db, tmp_path,
+                                                    capsys):
+    id = play_tournament(client, db, players=10, rounds=3, seed=1, seat=True)
+    matches = load_tournament(id).current_round().matches
+    client.get('/edit_pairings?player={}&opponent={}'.format(
+               matches[0].seat_1.id, matches[1].seat_1.id))
+
+    assert replay.replay(export(db, [id], tmp_path / 'edited.jsonl')) == 1
+    lines = [line for line in capsys.readouterr().out.splitlines()
+             if 'round' in line]
+    assert [': same' in line for line in lines] == [True, True, False]
+    assert 'round 3: DIFFERENT' in lines[2]
@@ -0,0 +1,47 @@
+import pytest
+
+from conftest import make_tournament
+from tournament.models import Tournament, load_tournament
+
+
+def report(client, results):
+    return client.post('/report_round', json={'results': results})
+
+
+def results(id, **result):
+    round = load_tournament(id).current_round()
+    return [dict(match=m.id, seat_1=m.seat_1_wins, seat_2=m.seat_2_wins,
+                 draws=m.draws, **result) for m in round.matches]
+
+
+@pytest.fixture
+def tournament(client, db):
+    id = make_tournament(db, players=8, rounds=1)
+    with client.session_transaction() as session:
+        session['tournament'] = id
+    return id
+
+
+def test_unchanged_results_are_not_reported_again(client, db, tournament):
+    version = db.session.get(Tournament, tournament).version
+    entries = results(tournament)
+    db.session.remove()
+
+    response = report(client, entries)
+    assert response.get_json() == {'reported': 0}
+    assert db.session.get(Tournament, tournament).version == version
+    db.session.remove()
+
+    entries[0].update(seat_1=1, seat_2=2)
+    response = report(client, entries)
+    assert response.get_json() == {'reported': 1}
+    assert db.session.get(Tournament, tournament).version == version + 1
+
+
+@pytest.mark.parametrize('body', [
+    [], 'results', {'results': {}}, {'results': 'x'}, {'results': [1]},
+    {'results': [[]]}])
+def test_malformed_reports_are_rejected(client, tournament, body):
+    response = client.post('/report_round', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,85 @@
+from collections import Counter, namedtuple
+from math import ceil
+
+import pytest
+from sqlalchemy import update
+
+from conftest import make_tournament
+from tournament.models import Player, load_tournament
+from tournament.seating import number_of_tables, table_sizes, seat, \
+    pair_by_seat
+
+
+def best_tables(player_count, ideal, smallest, largest):
+    """
+    The number of tables found by trying every possibility, preferring fewer
+    tables in a tie.
+    """
+    least = ceil(player_count / largest) if largest else 1
+    most = player_count // smallest if smallest else player_count
+    if least > most:
+        return least
+    return min(range(least, most + 1),
+               key=lambda t: (abs(player_count / t - ideal), t))
+
+
+@pytest.mark.parametrize('ideal, smallest, largest', [
+    (8, None, None), (8, 6, 10), (8, 7, 8), (6, 4, 6), (4, 3, None),
+    (10, None, 10), (8, 5, 5)])
+def test_tables_are_as_close_to_ideal_as_their_limits_allow(ideal, smallest,
+                                                           largest):
+    for n in range(1, 300):
+        tables = number_of_tables(n, ideal, smallest, largest)
+        assert tables == best_tables(n, ideal, smallest, largest), n
+
+        sizes = table_sizes(n, tables)
+        assert sum(sizes) == n
+        assert max(sizes) - min(sizes) <= 1
+        assert sizes == sorted(sizes, reverse=True)
+
+        # Tables are never too large, and only too small when there's no
+        # way to avoid it.
+        if largest:
+            assert max(sizes) <= largest, n
+        least = ceil(n / largest) if largest else 1
+        if smallest and least <= n // smallest:
+            assert min(sizes) >= smallest, n
+
+
+def test_tables_are_evenly_sized():
+    assert table_sizes(20, number_of_tables(20)) == [7, 7, 6]
+    assert table_sizes(17, number_of_tables(17)) == [9, 8]
+    assert table_sizes(17, number_of_tables(17, largest=8)) == [6, 6, 5]
+    assert number_of_tables(0) == 0 and table_sizes(0, 0) == []
+
+
+Seated = namedtuple('Seated', ['name', 'table', 'seat'])
+
+
+def test_players_are_seated_in_order_and_paired_across_their_tables():
+    seats = seat(list('abcdefghijk'), ideal=4)
+    assert [(t, s) for p, t, s in seats] == \
+        [(1, 1), (1, 2), (1, 3), (1, 4), (2, 1), (2, 2), (2, 3), (2, 4),
+         (3, 1), (3, 2), (3, 3)]
+
+    players = [Seated(p, t, s) for p, t, s in seats]
+    pairs = [(a.name, b.name if b else None)
+             for a, b in pair_by_seat(players)]
+    # Halfway round each table, then the last seats of odd tables.
+    assert pairs == [('a', 'c'), ('b', 'd'), ('e', 'g'), ('f', 'h'),
+                     ('i', 'j'), ('k', None)]
+
+
+def test_seating_uses_the_configured_limits(app, client, db, monkeypatch):
+    monkeypatch.setitem(app.config, 'IDEAL_TABLE', 8)
+    monkeypatch.setitem(app.config, 'MAX_TABLE', 6)
+    id = make_tournament(db, players=17, rounds=0)
+    db.session.execute(update(Player).values(table=0, seat=0))
+    db.session.commit()
+    with client.session_transaction() as session:
+        session['tournament'] = id
+
+    client.get('/seat')
+    db.session.remove()
+    tables = Counter(p.table for p in load_tournament(id).players)
+    assert sorted(tables.values(), reverse=True) == [6, 6, 5]
@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import make_tournament, play_tournament
+from tournament.models import Tournament, load_tournament
+from tournament.standings import get_standings, compute_standings, \
+    query_standings, rank
+
+
+def test_standings_are_not_shared_with_a_deleted_tournament(db):
+    # SQLite gives a new tournament the ID of the last one, if that one has
+    # been deleted, and versions start from zero again.
+    old = make_tournament(db, players=5, rounds=1)
+    assert len(get_standings(load_tournament(old))) == 5
+    db.session.delete(db.session.get(Tournament, old))
+    db.session.commit()
+    db.session.remove()
+
+    new = make_tournament(db, players=6, rounds=2)
+    assert new == old
+
+    tournament = load_tournament(new)
+    standings = get_standings(tournament)
+    assert [s.player.id for s in standings] == \
+        [s.player.id for s in compute_standings(tournament)]
+    assert len(standings) == 6
+
+
+@pytest.mark.parametrize('players, rounds, seed', [
+    (11, 4, 0), (12, 5, 1), (9, 3, 2), (16, 6, 3)])
+def test_the_database_computes_the_same_standings(client, db, players, rounds,
+                                                  seed):
+    # Draws, BYEs, a dropped player and an unreported round, among others.
+    id = play_tournament(client, db, players, rounds, drops=2, seed=seed)
+    tournament = load_tournament(id)
+
+    assert any(m.draws for r in tournament.rounds for m in r.matches)
+    assert any(m.is_bye() for r in tournament.rounds for m in r.matches)
+    assert not all(p.active for p in tournament.players)
+    assert not tournament.current_round().reporting_begun()
+
+    # Identical rows, in an identical order.
+    assert query_standings(tournament) == compute_standings(tournament)
+
+
+def test_ties_are_ranked_identically(client, db):
+    # Players who are tied on points and every tiebreaker are ranked by ID.
+    id = play_tournament(client, db, players=24, rounds=2, drops=0, seed=4)
+    tournament = load_tournament(id)
+    standings = compute_standings(tournament)
+    assert len({rank(s) for s in standings}) < len(standings)
+    assert all(a.player.id < b.player.id
+               for a, b in zip(standings, standings[1:]) if rank(a) == rank(b))
+
+    assert [s.player.id for s in query_standings(tournament)] == \
+        [s.player.id for s in standings]
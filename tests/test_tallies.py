@@ -0,0 +1,62 @@
+from conftest import play_tournament, report, RESULTS
+from tournament.models import TALLIES, load_tournament
+
+
+def check_tallies(db, id):
+    """
+    Checks that every player's running totals are what recounting them from
+    their matches gives.
+    """
+    db.session.remove()
+    tournament = load_tournament(id)
+    kept = {p.id: [getattr(p, column) for column in TALLIES]
+            for p in tournament.players}
+
+    tournament.recount()
+    counted = {p.id: [getattr(p, column) for column in TALLIES]
+               for p in tournament.players}
+    db.session.rollback()
+
+    assert kept == counted
+
+
+def test_running_totals_match_a_recount(client, db):
+    # Round 3 is paired, but not yet reported. (One of the nine players left
+    # has a BYE.)
+    id = play_tournament(client, db, players=10, rounds=3, drops=1)
+    check_tallies(db, id)
+    tournament = load_tournament(id)
+
+    # Swapping players (the one with a BYE included) between matches.
+    matches = tournament.current_round().matches
+    bye = [m for m in matches if not m.seat_2][0]
+    swaps = [(matches[0].seat_1, matches[1].seat_2),
+             (bye.seat_1, matches[0].seat_1)]
+    for player, opponent in swaps:
+        client.get('/edit_pairings?player={}&opponent={}'.format(
+                   player.id, opponent.id))
+        check_tallies(db, id)
+        players = {p.id: p for p in load_tournament(id).players}
+        assert players[player.id].opponent().id == opponent.id
+
+    # Reporting each match, then reporting it again (overwriting the result
+    # each time). The BYE is reported along with the first result.
+    tournament = load_tournament(id)
+    matches = [m.id for m in tournament.current_round().matches if m.seat_2]
+    assert tournament.current_round().round_number == 3
+    reported = [2] + [1] * (3 * len(matches) - 1)
+    for i, match in enumerate(matches):
+        for result in (RESULTS[i], RESULTS[i + 1], RESULTS[-1]):
+            assert report(client, match, result).get_json() == \
+                {'reported': reported.pop(0)}
+            check_tallies(db, id)
+
+    # Dropping a player.
+    player = tournament.active_players()[0].id
+    db.session.remove()
+    client.get('/drop?player={}'.format(player))
+    check_tallies(db, id)
+
+    tournament = load_tournament(id)
+    assert not [p for p in tournament.players if p.id == player][0].active
+    assert tournament.current_round().reporting_complete()
@@ -0,0 +1,24 @@
+from conftest import make_tournament, sign_in
+
+
+def test_organizers_with_numeric_ids_can_manage_their_tournaments(app, db):
+    # Users' IDs come from their login and are text, even if they look like
+    # numbers.
+    client = sign_in(app, db, '12345')
+    id = make_tournament(db, user_id='12345')
+
+    page = client.get('/list').get_data(as_text=True)
+    assert '/resume?id={}'.format(id) in page
+    assert '/delete?id={}'.format(id) in page
+
+
+def test_only_organizers_can_use_the_api_when_it_requires_login(app, db,
+                                                                  monkeypatch):
+    monkeypatch.setitem(app.config, 'API_LOGIN_REQUIRED', True)
+    owner = sign_in(app, db, '12345')
+    other = sign_in(app, db, '54321')
+    url = '/api/v1/tournaments/{}'.format(make_tournament(db, user_id='12345'))
+
+    assert owner.get(url).status_code == 200
+    assert other.get(url).status_code == 403
+    assert app.test_client().get(url).status_code == 403
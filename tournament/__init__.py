@@ -1,24 +1,44 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+import logging
 
 
 app = Flask(__name__)
 app.config.from_object('config')
-db = SQLAlchemy(app)
+
+# Settings may also be overridden by environment variables prefixed with FLASK_
+# (e.g. FLASK_SQLALCHEMY_DATABASE_URI), which is how benchmark.py points the
+# app at a database of its own.
+app.config.from_prefixed_env()
+
+# Every module logs through the app's logger (whose name is the package's).
+if 'LOG_LEVEL' in app.config:
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+
+log = logging.getLogger(__name__)
+
+# Objects aren't expired on commit, so that a tournament loaded at the start of
+# a request stays loaded until the end of it. (The session is discarded at the
+# end of every request anyway.)
+db = SQLAlchemy(app, session_options={'expire_on_commit': False})
 
 lm = LoginManager()
 lm.init_app(app)
 lm.login_view = 'login'
 
 
-# Ensure that tables are created. The order in which this occurs is important:
+# Ensure that the schema is up to date. The order in which this occurs is
+# important:
 # 1. Initialize the SQLAlchemy object.
 # 2. Import the models. (The schema will need to import the SQLAlchemy object.)
-# 3. Ensure that the tables are created. (Models must be imported first.)
-from tournament import models
+# 3. Create the tables, or migrate them. (Models must be imported first.)
+from tournament import models, migrations
 with app.app_context():
-    db.create_all()
+    migrations.upgrade(log=log.info)
 
 
+from tournament import instrumentation
+from tournament import metrics
 from tournament import views
+from tournament import api
@@ -0,0 +1,212 @@
+from flask import request, jsonify, Response, stream_with_context
+from flask_login import current_user
+from sqlalchemy import func
+
+from tournament import app, db, jobs
+from tournament.models import Tournament, Round, load_tournament
+from tournament.standings import get_standings
+from tournament.events import broker, format_event
+
+
+# A read-only JSON API for scoreboards, pairing displays and scripts. Every
+# response carries an ETag derived from the tournament's version, so clients
+# polling with If-None-Match get a 304 (for the cost of a single small query)
+# until pairings or results actually change.
+
+
+@app.route('/api/v1/tournaments/<int:id>')
+def api_tournament(id):
+    def build(tournament):
+        round = tournament.current_round()
+        return {"id": tournament.id,
+                "name": tournament.name,
+                "round": round.round_number if round else None,
+                "players": len(tournament.players),
+                "version": tournament.version}
+
+    return respond(id, build)
+
+
+@app.route('/api/v1/tournaments/<int:id>/players')
+def api_players(id):
+    def build(tournament):
+        return {"players": [player_json(p) for p in tournament.players]}
+
+    return respond(id, build)
+
+
+@app.route('/api/v1/tournaments/<int:id>/rounds')
+def api_rounds(id):
+    def build(tournament):
+        return {"rounds": [{"round": r.round_number,
+                            "matches": [match_json(m) for m in r.matches]}
+                           for r in tournament.rounds]}
+
+    return respond(id, build)
+
+
+@app.route('/api/v1/tournaments/<int:id>/pairings')
+def api_pairings(id):
+    def build(tournament):
+        round = tournament.current_round()
+        if not round:
+            return {"round": None, "pairings": []}
+
+        return {"round": round.round_number,
+                "pairings": [match_json(m) for m in round.matches]}
+
+    return respond(id, build)
+
+
+@app.route('/api/v1/tournaments/<int:id>/standings')
+def api_standings(id):
+    def build(tournament):
+        return {"standings": [{"rank": i + 1,
+                               "player": player_json(s.player),
+                               "points": s.points,
+                               "tb_1": s.tb_1,
+                               "tb_2": s.tb_2,
+                               "tb_3": s.tb_3}
+                              for i, s in enumerate(get_standings(tournament))]}
+
+    return respond(id, build)
+
+
+@app.route('/api/v1/tournaments/<int:id>/events')
+def api_events(id):
+    """
+    Streams server-sent events as the tournament changes: "pairings" when
+    players are paired (or re-paired), "results" when results are reported and
+    "drop" when a player drops. Each event's data describes only what changed,
+    and its ID is the tournament's new version. A "refresh" event means that
+    the client may have missed something, and should reload everything.
+    """
+    tournament, error = find(id)
+    if error:
+        return error
+
+    keepalive = app.config.get("EVENT_KEEPALIVE", 15)
+    last = request.headers.get("Last-Event-ID", type=int)
+    queue = broker.subscribe(id)
+
+    # Don't hold on to a database connection for as long as the client stays.
+    db.session.remove()
+
+    def stream():
+        seen = tournament.version
+        try:
+            if last is not None and last != seen:
+                yield format_event("refresh", {}, seen).text
+
+            while True:
+                event = broker.listen(queue, keepalive)
+
+                if event:
+                    seen = max(seen, event.version)
+                    yield event.text
+                    continue
+
+                # Changes made by other server processes aren't published
+                # here, so check for them every so often.
+                with db.engine.connect() as connection:
+                    version = connection.execute(
+                        db.select(Tournament.version).filter_by(id=id)
+                    ).scalar()
+
+                if version is not None and version != seen:
+                    seen = version
+                    yield format_event("refresh", {}, seen).text
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            broker.unsubscribe(id, queue)
+
+    return Response(stream_with_context(stream()),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+
+@app.route('/api/v1/tournaments/<int:id>/pairing')
+def api_pairing(id):
+    """
+    Reports on the round being paired in the background (if it was started by
+    this process), along with the tournament's current round, so that clients
+    can tell when pairing has finished. Never cached.
+    """
+    tournament, error = find(id)
+    if error:
+        return error
+
+    job = jobs.find(id)
+    round = db.session.query(func.max(Round.round_number)) \
+                      .filter_by(tournament_id=id).scalar()
+    response = jsonify(round=round, version=tournament.version,
+                       job=job.json() if job else None)
+    response.cache_control.no_store = True
+    return response
+
+
+def find(id):
+    """
+    Looks up the tournament's version and token (without loading the
+    tournament) and checks that the current user may see it. Returns the row
+    and None, or None and an error response.
+    """
+    tournament = db.session.query(Tournament.version, Tournament.token,
+                                  Tournament.user_id) \
+                           .filter_by(id=id).first()
+
+    if not tournament:
+        return None, (jsonify(error="The specified tournament does not "
+                                    "exist."), 404)
+
+    if app.config.get("API_LOGIN_REQUIRED", False) and \
+            (not current_user.is_authenticated or
+             current_user.id != tournament.user_id):
+        return None, (jsonify(error="You do not have permission to access "
+                                    "this tournament."), 403)
+
+    return tournament, None
+
+
+def respond(id, build):
+    """
+    Returns a 304 if the client already has the current version of the
+    resource. Otherwise, loads the tournament and returns the JSON produced by
+    build(tournament), along with its ETag.
+    """
+    tournament, error = find(id)
+    if error:
+        return error
+
+    # The token keeps a new tournament that reuses a deleted one's ID (and
+    # starts again from version 0) from matching the old one's ETags.
+    etag = "{}-{}.{}-{}".format(request.endpoint, id, tournament.token,
+                                tournament.version)
+
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build(load_tournament(id)))
+
+    # Clients may keep responses, but must check that they're still current.
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def player_json(p):
+    return {"id": p.id, "name": p.name, "active": p.active, "table": p.table,
+            "seat": p.seat}
+
+
+def match_json(m):
+    return {"id": m.id,
+            "table": m.table_number,
+            "seat_1": player_json(m.seat_1) if m.seat_1 else None,
+            "seat_2": player_json(m.seat_2) if m.seat_2 else None,
+            "seat_1_wins": m.seat_1_wins,
+            "seat_2_wins": m.seat_2_wins,
+            "draws": m.draws,
+            "reported": m.reported()}
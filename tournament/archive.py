@@ -0,0 +1,302 @@
+from sqlalchemy import select, insert, delete, exists, and_
+from json import dumps, loads
+import gzip
+import os
+
+from tournament import db
+from tournament.models import Tournament, Round, Match, Player, TALLIES
+
+
+# Tournaments are exported (and archived) as JSON Lines: one tournament per
+# line, with its players, rounds and matches nested inside it. (Players' running
+# totals aren't included, since they can be recounted from the matches.)
+# Everything is read, written and deleted with set-based queries, a batch of
+# tournaments at a time, and files are read and written a line at a time, so no
+# matter how many tournaments there are, none of them are loaded into the
+# session and memory use stays flat.
+
+FORMAT = 1
+
+
+def select_tournaments(ids=None, user_id=None, finished=False):
+    """
+    Returns a query for the IDs of the specified tournaments (or every
+    tournament). Finished tournaments are those which have been paired at least
+    once, and have had every match reported.
+    """
+    query = select(Tournament.id).order_by(Tournament.id)
+
+    if ids:
+        query = query.where(Tournament.id.in_(ids))
+
+    if user_id is not None:
+        query = query.where(Tournament.user_id == user_id)
+
+    if finished:
+        unreported = and_(Match.tournament_id == Tournament.id,
+                          Match.seat_1_wins + Match.seat_2_wins +
+                          Match.draws == 0)
+        query = query.where(exists().where(Round.tournament_id ==
+                                           Tournament.id),
+                            ~exists().where(unreported))
+
+    return query
+
+
+def dump(ids):
+    """
+    Yields each of the tournaments (as archive documents) in order of ID.
+    """
+    players, rounds, matches = {}, {}, {}
+
+    for row in db.session.execute(
+            select(Player.tournament_id, Player.id, Player.name, Player.active,
+                   Player.table, Player.seat)
+            .where(Player.tournament_id.in_(ids)).order_by(Player.id)):
+        players.setdefault(row.tournament_id, []).append(
+            {"id": row.id, "name": row.name, "active": row.active,
+             "table": row.table, "seat": row.seat})
+
+    for row in db.session.execute(
+            select(Match.round_id, Match.table_number, Match.seat_1_id,
+                   Match.seat_2_id, Match.seat_1_wins, Match.seat_2_wins,
+                   Match.draws)
+            .where(Match.tournament_id.in_(ids)).order_by(Match.table_number)):
+        matches.setdefault(row.round_id, []).append(
+            {"table": row.table_number, "seat_1": row.seat_1_id,
+             "seat_2": row.seat_2_id, "seat_1_wins": row.seat_1_wins,
+             "seat_2_wins": row.seat_2_wins, "draws": row.draws})
+
+    for row in db.session.execute(
+            select(Round.tournament_id, Round.id, Round.round_number)
+            .where(Round.tournament_id.in_(ids))
+            .order_by(Round.round_number)):
+        rounds.setdefault(row.tournament_id, []).append(
+            {"round": row.round_number, "matches": matches.get(row.id, [])})
+
+    for row in db.session.execute(
+            select(Tournament.id, Tournament.name, Tournament.user_id,
+                   Tournament.version, Tournament.seed)
+            .where(Tournament.id.in_(ids)).order_by(Tournament.id)):
+        yield {"format": FORMAT, "id": row.id, "name": row.name,
+               "user_id": row.user_id, "version": row.version,
+               "seed": row.seed,
+               "players": players.get(row.id, []),
+               "rounds": rounds.get(row.id, [])}
+
+
+def delete_tournaments(ids):
+    """
+    Deletes the tournaments, along with all of their players, rounds and
+    matches, in four statements. (The caller commits.)
+    """
+    db.session.execute(delete(Match).where(Match.tournament_id.in_(ids)))
+    db.session.execute(delete(Round).where(Round.tournament_id.in_(ids)))
+    db.session.execute(delete(Player).where(Player.tournament_id.in_(ids)))
+    db.session.execute(delete(Tournament).where(Tournament.id.in_(ids)))
+
+
+def open_archive(path, mode='a'):
+    """
+    Opens an archive file for appending (or for reading or writing, depending
+    on the mode), compressed if the name ends in .gz.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def write(f, documents):
+    """
+    Writes the documents to an open archive file, and makes sure that they've
+    made it to disk.
+    """
+    for document in documents:
+        f.write(dumps(document, separators=(',', ':')) + '\n')
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def read(path):
+    """
+    Yields each tournament in an archive file, one at a time.
+    """
+    with open_archive(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+
+            document = loads(line)
+            if document.get("format") != FORMAT:
+                raise ValueError("Line {} of {} isn't a tournament in a "
+                                 "format that can be imported.".format(
+                                 number, path))
+            yield document
+
+
+def export(query, path, batch=100, progress=None):
+    """
+    Writes the tournaments found by the query to a new archive file, a batch
+    at a time. If given, progress(done, total) is called after each batch.
+    Returns the number of tournaments exported.
+    """
+    ids = db.session.execute(query).scalars().all()
+    total = len(ids)
+
+    with open_archive(path, 'w') as f:
+        for i in range(0, total, batch):
+            write(f, dump(ids[i:i + batch]))
+            if progress:
+                progress(min(i + batch, total), total)
+
+    return total
+
+
+def load(documents, user_id=None, batch=100, progress=None):
+    """
+    Adds the tournaments (as archive documents, from any iterable) to the
+    database, a batch at a time, with one bulk insert per table per batch.
+    Tournaments, players and rounds get new IDs. Tournaments keep their owners,
+    unless a user_id is given. If given, progress(done) is called after each
+    batch. Returns the IDs of the new tournaments.
+    """
+    ids = []
+    chunk = []
+
+    for document in documents:
+        chunk.append(document)
+        if len(chunk) == batch:
+            ids += insert_tournaments(chunk, user_id)
+            if progress:
+                progress(len(ids))
+            chunk = []
+
+    if chunk:
+        ids += insert_tournaments(chunk, user_id)
+        if progress:
+            progress(len(ids))
+
+    return ids
+
+
+def insert_tournaments(documents, user_id=None):
+    """
+    Inserts a batch of tournaments, and commits. Returns their new IDs.
+    """
+    # New IDs come back in the order that the rows were given in, so the old
+    # IDs in each document can be mapped to the new ones.
+    def bulk(model, rows):
+        if not rows:
+            return []
+        return db.session.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            rows).scalars().all()
+
+    tournaments = bulk(Tournament, [
+        {"name": d["name"], "version": d.get("version", 0),
+         "seed": d.get("seed"),
+         "user_id": d["user_id"] if user_id is None else user_id}
+        for d in documents])
+
+    players, keys = [], []
+    for d, id in zip(documents, tournaments):
+        totals = tallies(d)
+        for p in d["players"]:
+            row = {"tournament_id": id, "name": p["name"],
+                   "active": p["active"], "table": p["table"],
+                   "seat": p["seat"]}
+            row.update(totals.get(p["id"], {}))
+            players.append(row)
+            keys.append((id, p["id"]))
+    players = dict(zip(keys, bulk(Player, players)))
+
+    rounds, keys = [], []
+    for d, id in zip(documents, tournaments):
+        for r in d["rounds"]:
+            rounds.append({"tournament_id": id, "round_number": r["round"]})
+            keys.append((id, r["round"]))
+    rounds = dict(zip(keys, bulk(Round, rounds)))
+
+    matches = []
+    for d, id in zip(documents, tournaments):
+        for r in d["rounds"]:
+            for m in r["matches"]:
+                matches.append({
+                    "tournament_id": id, "round_id": rounds[id, r["round"]],
+                    "table_number": m["table"],
+                    "seat_1_id": players.get((id, m["seat_1"])),
+                    "seat_2_id": players.get((id, m["seat_2"])),
+                    "seat_1_wins": m["seat_1_wins"],
+                    "seat_2_wins": m["seat_2_wins"], "draws": m["draws"]})
+    if matches:
+        db.session.execute(insert(Match), matches)
+
+    db.session.commit()
+    return tournaments
+
+
+def tallies(document):
+    """
+    Works out each player's running totals from a tournament document's
+    matches, as Match.tally() would. Returns them by (the document's) player
+    ID.
+    """
+    totals = {p["id"]: dict.fromkeys(TALLIES, 0) for p in document["players"]}
+
+    for r in document["rounds"]:
+        for m in r["matches"]:
+            games = m["seat_1_wins"] + m["seat_2_wins"] + m["draws"]
+            if not games:
+                continue
+
+            for seat, other in (("seat_1", "seat_2"), ("seat_2", "seat_1")):
+                t = totals.get(m[seat])
+                if t is None:
+                    continue
+
+                t["match_count"] += 1
+                t["game_count"] += games
+                t["game_win_count"] += m[seat + "_wins"]
+                t["game_draw_count"] += m["draws"]
+
+                if m[seat + "_wins"] > m[other + "_wins"]:
+                    t["match_win_count"] += 1
+                elif m[seat + "_wins"] == m[other + "_wins"]:
+                    t["match_draw_count"] += 1
+
+                if m[other] is None:
+                    t["bye_count"] += 1
+
+    return totals
+
+
+def clear(query, archive=None, batch=100, progress=None):
+    """
+    Deletes the tournaments found by the query, a batch at a time, committing
+    after each batch. If an archive path is given, each batch is written to it
+    (and flushed to disk) before being deleted. If given, progress(done, total)
+    is called after each batch. Returns the number of tournaments deleted.
+    """
+    ids = db.session.execute(query).scalars().all()
+    total = len(ids)
+    done = 0
+
+    f = open_archive(archive) if archive else None
+    try:
+        for i in range(0, total, batch):
+            chunk = ids[i:i + batch]
+
+            if f:
+                write(f, dump(chunk))
+
+            delete_tournaments(chunk)
+            db.session.commit()
+
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+    finally:
+        if f:
+            f.close()
+
+    return done
@@ -1,72 +1,236 @@
-from ldap3 import Server, Connection
-from json import loads
+from ldap3 import Server, Connection, RESTARTABLE
+from ldap3.utils.conv import escape_filter_chars
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from queue import LifoQueue, Empty, Full
+from threading import Lock
+from hashlib import sha256
+import hmac
+import os
 import requests
 
 from tournament import app
 from tournament.models import User
+from tournament.cache import LRUCache
+from tournament.metrics import login_seconds, login_failures
 
 
 def authenticate(username, password):
-    if app.config.get('AUTH_METHOD', 'ldap').lower() == 'ldap':
-        return ldap(username, password)
-    else:
-        return auth(username, password)
+    method = app.config.get('AUTH_METHOD', 'ldap').lower()
+
+    with login_seconds.time(method=method):
+        if method == 'ldap':
+            user, message = ldap(username, password)
+        else:
+            user, message = auth(username, password)
+
+    if not user:
+        login_failures.inc(method=method)
+
+    return user, message
+
+
+class Pool:
+    """
+    Keeps up to size bound connections to the LDAP server, so that looking a
+    user up doesn't mean connecting (and binding) every time. If every
+    connection is in use, another is made, but only size are kept afterward.
+    """
+
+    def __init__(self, connect, size=4):
+        self.connect = connect
+        self.idle = LifoQueue(size)
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            return self.connect()
+
+    def release(self, connection):
+        try:
+            self.idle.put_nowait(connection)
+        except Full:
+            discard(connection)
+
+
+def discard(connection):
+    try:
+        connection.unbind()
+    except Exception:
+        pass
+
+
+# The LDAP server, the pool of connections to it and the cache of users'
+# entries. They're only set up when first needed, since they aren't if another
+# authentication method is used.
+directory = {}
+directory_lock = Lock()
+
+
+def connect_directory():
+    with directory_lock:
+        if not directory:
+            directory['server'] = Server(
+                app.config['LDAP_URI'],
+                connect_timeout=app.config.get('LDAP_TIMEOUT', 5))
+            directory['pool'] = Pool(service_connection,
+                                     app.config.get('LDAP_POOL_SIZE', 4))
+            directory['entries'] = LRUCache(
+                app.config.get('LDAP_CACHE_SIZE', 1024),
+                app.config.get('LDAP_CACHE_TTL', 600))
+        return directory
+
+
+def service_connection():
+    """
+    Connects to the LDAP server to look users up (anonymously, unless
+    LDAP_BIND_DN and LDAP_BIND_PASSWORD are configured). The connection
+    reconnects by itself if the server drops it.
+    """
+    return Connection(directory['server'],
+                      user=app.config.get('LDAP_BIND_DN'),
+                      password=app.config.get('LDAP_BIND_PASSWORD'),
+                      client_strategy=RESTARTABLE, auto_bind=True,
+                      receive_timeout=app.config.get('LDAP_TIMEOUT', 5))
+
+
+def lookup(username):
+    """
+    Returns the user's directory entry (as a dict with their dn, name and
+    email address), or None if there's no such user. Entries are cached for
+    LDAP_CACHE_TTL seconds.
+    """
+    directory = connect_directory()
+    entry = directory['entries'].get(username)
+    if entry:
+        return entry
+
+    pool = directory['pool']
+    connection = pool.acquire()
+
+    try:
+        result = connection.search(
+            search_base=app.config['LDAP_SEARCH_BASE'],
+            search_filter='(uid={})'.format(escape_filter_chars(username)),
+            attributes=['mail', 'cn'])
+        response = connection.response
+    except Exception:
+        discard(connection)
+        raise
+
+    pool.release(connection)
+
+    if not result or not response:
+        return None
+
+    entry = {'dn': response[0]['dn'],
+             'name': response[0]['attributes']['cn'][0],
+             'email': response[0]['attributes']['mail'][0]}
+    directory['entries'].set(username, entry)
+    return entry
 
 
 def ldap(username, password):
     user = None
     message = None
-
-    # Initial connection to the LDAP server.
-    server = Server(app.config['LDAP_URI'])
-    connection = Connection(server)
+    connection = None
 
     try:
-        if not connection.bind(): return None
-
         # Verify that the user exists.
-        result = connection.search(search_base=app.config['LDAP_SEARCH_BASE'],
-                                   search_filter='(uid={})'.format(username),
-                                   attributes=['mail', 'cn'])
-
-        if not result: return None
+        entry = lookup(username)
 
-        # The user exists!
-        name = connection.response[0]['attributes']['cn'][0]
-        email = connection.response[0]['attributes']['mail'][0]
+        # Servers may treat a bind without a password as anonymous, which
+        # would always succeed.
+        if not entry or not password:
+            return None
 
-        # Now attempt to re-bind and authenticate with the password.
-        distinguished_name = connection.response[0]['dn']
-        connection = Connection(server, user=distinguished_name,
-                                password=password.encode('iso8859-1'))
+        # The user exists! Now attempt to bind as them, with the password.
+        connection = Connection(connect_directory()['server'],
+                                user=entry['dn'],
+                                password=password.encode('iso8859-1'),
+                                receive_timeout=app.config.get('LDAP_TIMEOUT',
+                                                               5))
 
         if not connection.bind(): return None
 
         # We're authenticated! Create the actual user object.
-        user = User(id=username, name=name, email=email)
-    
+        user = User(id=username, name=entry['name'], email=entry['email'])
+
     except Exception as e:
         message = e
 
     finally:
-        connection.unbind()
+        if connection:
+            discard(connection)
+        if not user and not message:
+            message = "Invalid username or password."
         return user, message
 
 
+# The HTTP session used to reach AUTH_URI, and the cache of users who have
+# recently signed in through it. Like the directory, they're only set up when
+# first needed.
+service = {}
+service_lock = Lock()
+
+
+def connect_service():
+    with service_lock:
+        if not service:
+            # Requests are retried if the server can't be reached or says that
+            # it's unavailable, but not if it's slow to answer (which would
+            # only keep the worker waiting longer).
+            retry = Retry(total=app.config.get('AUTH_RETRIES', 2), read=0,
+                          backoff_factor=app.config.get('AUTH_BACKOFF', 0.25),
+                          status_forcelist=(502, 503, 504),
+                          allowed_methods=None, raise_on_status=False)
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(max_retries=retry))
+            session.mount('https://', HTTPAdapter(max_retries=retry))
+            service['session'] = session
+            service['users'] = LRUCache(
+                app.config.get('AUTH_CACHE_SIZE', 1024),
+                app.config.get('AUTH_CACHE_TTL', 60))
+
+            # Cached users are keyed by a keyed hash of their credentials, so
+            # that passwords are never kept in memory.
+            service['key'] = os.urandom(32)
+        return service
+
+
+def credentials(username, password):
+    message = '{}\0{}'.format(username, password).encode()
+    return hmac.new(service['key'], message, sha256).hexdigest()
+
+
 def auth(username, password):
     user = None
     message = None
 
+    service = connect_service()
+    key = credentials(username, password)
+    identity = service['users'].get(key)
+    if identity:
+        return User(**identity), message
+
     data = {'id': username, 'password': password}
     headers = {'Content-Type': 'application/json'}
 
-    r = requests.post(app.config['AUTH_URI'], json=data, headers=headers)
+    try:
+        r = service['session'].post(app.config['AUTH_URI'], json=data,
+                                    headers=headers,
+                                    timeout=app.config.get('AUTH_TIMEOUT', 5))
+    except requests.RequestException:
+        return user, "The authentication server could not be reached."
 
     if r.status_code == 200:
-        json = loads(r.text)
-        user = User(id=json['id'], name=json['name'], email=json['email'])
+        json = r.json()
+        identity = {'id': json['id'], 'name': json['name'],
+                    'email': json['email']}
+        service['users'].set(key, identity)
+        user = User(**identity)
     else:
         message = r.text
 
     return user, message
-
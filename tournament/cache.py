@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from threading import Lock
+from json import dumps, loads
+from time import monotonic
+
+
+class LRUCache:
+    """
+    A thread-safe, in-process cache which discards the least recently used
+    values once it holds more than the given number of them, and (if given a
+    ttl) values that are more than ttl seconds old.
+    """
+
+    def __init__(self, size=128, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.values = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.values:
+                return None
+            expires, value = self.values[key]
+            if expires is not None and expires < monotonic():
+                del self.values[key]
+                return None
+            self.values.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.values[key] = (expires, value)
+            self.values.move_to_end(key)
+            while len(self.values) > self.size:
+                self.values.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.values.pop(key, None)
+
+
+class RedisCache:
+    """
+    Stores values as JSON in Redis, or in anything else that provides the same
+    get(key) and set(key, value, ex=seconds) methods. Values must be
+    JSON-serializable (tuples come back as lists).
+    """
+
+    def __init__(self, client, prefix='tournament:', expiry=3600):
+        self.client = client
+        self.prefix = prefix
+        self.expiry = expiry
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, dumps(value), ex=self.expiry)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def create_cache(backend=None, size=128):
+    """
+    Creates a cache from a config value, which may be None (for an in-process
+    LRU cache), a Redis URL, or a Redis client (or any stand-in for one).
+    """
+    if backend is None:
+        return LRUCache(size)
+
+    if isinstance(backend, str):
+        # Redis is only required if it's actually used.
+        import redis
+        backend = redis.Redis.from_url(backend)
+
+    return RedisCache(backend)
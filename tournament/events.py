@@ -0,0 +1,74 @@
+from collections import namedtuple
+from threading import Lock
+from queue import Queue, Empty, Full
+from json import dumps
+
+
+# A server-sent event, already formatted for the stream. The version is that of
+# the tournament once the change that it describes was committed.
+Event = namedtuple('Event', ['version', 'text'])
+
+
+class Broker:
+    """
+    Passes events from the views that change a tournament to every client
+    streaming that tournament's events (in this process). Each client has its
+    own bounded queue, so publishing never blocks on a slow client, and waiting
+    clients don't use any CPU. (Under gevent, they don't use a thread either.)
+    """
+
+    def __init__(self, backlog=64):
+        self.backlog = backlog
+        self.lock = Lock()
+        self.channels = {}
+
+    def subscribe(self, tournament_id):
+        queue = Queue(self.backlog)
+        with self.lock:
+            self.channels.setdefault(tournament_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, tournament_id, queue):
+        with self.lock:
+            channel = self.channels.get(tournament_id, set())
+            channel.discard(queue)
+            if not channel:
+                self.channels.pop(tournament_id, None)
+
+    def publish(self, tournament_id, event):
+        with self.lock:
+            queues = list(self.channels.get(tournament_id, ()))
+
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except Full:
+                # The client has fallen too far behind. It will notice that
+                # it's missed something on its next keepalive.
+                pass
+
+    def listen(self, queue, timeout):
+        """
+        Waits for the next event in the queue, or returns None after timeout
+        seconds.
+        """
+        try:
+            return queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+broker = Broker()
+
+
+def format_event(event, data, version):
+    return Event(version, 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+                 version, event, dumps(data)))
+
+
+def publish(tournament, event, data):
+    """
+    Sends an event describing a (committed) change to everyone watching the
+    tournament.
+    """
+    broker.publish(tournament.id, format_event(event, data, tournament.version))
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, BooleanField, HiddenField, PasswordField, \
-    IntegerField
+from wtforms import Form, StringField, BooleanField, HiddenField, \
+    PasswordField, IntegerField, FieldList, FormField
 from wtforms.validators import DataRequired, NumberRange
 
 
@@ -17,8 +17,16 @@ class CreateForm(FlaskForm):
     add = StringField(label="Add Player")
 
 
-class ReportForm(FlaskForm):
+class ResultForm(Form):
     match = HiddenField(label="Match", validators=[DataRequired()])
     seat_1 = IntegerField(default=0, validators=[NumberRange(min=0)])
     seat_2 = IntegerField(default=0, validators=[NumberRange(min=0)])
     draws = IntegerField(label="Draws", default=0, validators=[NumberRange(min=0)])
+
+
+class ReportForm(FlaskForm, ResultForm):
+    pass
+
+
+class RoundReportForm(FlaskForm):
+    results = FieldList(FormField(ResultForm))
@@ -0,0 +1,185 @@
+from flask import g, request, jsonify, has_app_context
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Lock
+from time import perf_counter, strftime
+import logging
+import os
+
+from tournament import app
+
+
+# Measures where each request's time goes: how long it took, how many database
+# queries it made and how long they took. The figures are sent back in response
+# headers (X-Response-Time, X-DB-Queries and X-DB-Time, in milliseconds),
+# logged (at DEBUG level, or WARNING for slow queries), and added up by
+# endpoint for /debug/metrics. Requests with a "profile" parameter can also be
+# profiled.
+#
+# Nothing here is set up unless INSTRUMENTATION is set, in which case no hooks
+# or event listeners are registered at all, so it costs nothing when it's off.
+
+log = logging.getLogger(__name__)
+
+
+class Metrics:
+    """
+    Running totals for each endpoint (in this process): the number of
+    requests, their total and longest times, and the number and total time of
+    their queries.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, elapsed, queries, query_time):
+        with self.lock:
+            totals = self.endpoints.setdefault(endpoint, {
+                "requests": 0, "time": 0.0, "max_time": 0.0, "queries": 0,
+                "query_time": 0.0})
+            totals["requests"] += 1
+            totals["time"] += elapsed
+            totals["max_time"] = max(totals["max_time"], elapsed)
+            totals["queries"] += queries
+            totals["query_time"] += query_time
+
+    def snapshot(self):
+        """
+        Returns the totals for each endpoint, in milliseconds, along with
+        averages per request.
+        """
+        with self.lock:
+            endpoints = {k: dict(v) for k, v in self.endpoints.items()}
+
+        for totals in endpoints.values():
+            count = totals["requests"]
+            totals["mean_time"] = totals["time"] / count
+            totals["mean_queries"] = totals["queries"] / count
+            for key in ("time", "max_time", "query_time", "mean_time"):
+                totals[key] = round(totals[key] * 1000, 3)
+
+        return endpoints
+
+
+metrics = Metrics()
+
+
+def start_query(connection, cursor, statement, parameters, context,
+                executemany):
+    connection.info.setdefault('query_started', []).append(perf_counter())
+
+
+def finish_query(connection, cursor, statement, parameters, context,
+                 executemany):
+    elapsed = perf_counter() - connection.info['query_started'].pop()
+
+    if elapsed > app.config.get('SLOW_QUERY', 0.1):
+        log.warning('Slow query (%.1fms): %s', elapsed * 1000, statement)
+
+    if has_app_context():
+        g.queries = g.get('queries', 0) + 1
+        g.query_time = g.get('query_time', 0.0) + elapsed
+
+
+def abandon_query(context):
+    # Queries that fail are never finished.
+    if context.connection is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+def start_request():
+    # g may be shared with earlier requests (see before_request in views).
+    g.started = perf_counter()
+    g.queries = 0
+    g.query_time = 0.0
+
+    if app.config.get('PROFILER') and 'profile' in request.args:
+        g.profiler = start_profiler(app.config['PROFILER'])
+
+
+def finish_request(response):
+    if 'started' not in g:
+        return response
+
+    elapsed = perf_counter() - g.started
+    queries = g.get('queries', 0)
+    query_time = g.get('query_time', 0.0)
+
+    if 'profiler' in g:
+        response.headers['X-Profile'] = stop_profiler(g.pop('profiler'))
+
+    response.headers['X-Response-Time'] = '{:.1f}'.format(elapsed * 1000)
+    response.headers['X-DB-Queries'] = str(queries)
+    response.headers['X-DB-Time'] = '{:.1f}'.format(query_time * 1000)
+
+    metrics.record(request.endpoint or 'unknown', elapsed, queries,
+                   query_time)
+    log.debug('%s %s %s %.1fms %d queries (%.1fms)', request.method,
+              request.path, response.status_code, elapsed * 1000, queries,
+              query_time * 1000)
+
+    return response
+
+
+def start_profiler(name):
+    """
+    Starts profiling with cProfile or (if it's installed) pyinstrument.
+    """
+    if name == 'pyinstrument':
+        # pyinstrument is only required if it's actually used.
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+    else:
+        from cProfile import Profile
+        profiler = Profile()
+        profiler.enable()
+
+    return profiler
+
+
+def stop_profiler(profiler):
+    """
+    Stops the profiler and saves its results in PROFILE_DIR (a .prof file for
+    cProfile, or an HTML page for pyinstrument). Returns the file's name.
+    """
+    directory = app.config.get('PROFILE_DIR', 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    name = '{}-{}-{}'.format(strftime('%Y%m%d-%H%M%S'), request.endpoint,
+                             id(profiler))
+
+    if hasattr(profiler, 'output_html'):
+        profiler.stop()
+        name += '.html'
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        name += '.prof'
+        profiler.dump_stats(os.path.join(directory, name))
+
+    return name
+
+
+def debug_metrics():
+    """
+    Returns the totals for each endpoint as JSON (for administrators only).
+    """
+    if not current_user.is_authenticated or not current_user.is_admin():
+        return jsonify(error="You do not have permission to view "
+                             "metrics."), 403
+
+    return jsonify(endpoints=metrics.snapshot())
+
+
+if app.config.get('INSTRUMENTATION', False):
+    event.listen(Engine, 'before_cursor_execute', start_query)
+    event.listen(Engine, 'after_cursor_execute', finish_query)
+    event.listen(Engine, 'handle_error', abandon_query)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/debug/metrics', 'debug_metrics', debug_metrics)
@@ -0,0 +1,160 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from threading import Lock, Thread
+from time import monotonic
+import logging
+
+from tournament import app, db
+from tournament.models import StaleTournament, load_tournament
+
+
+# Pairing a large round with the matching engine can take longer than a request
+# should. When PAIRING_WORKERS is set, rounds with at least PAIRING_JOB_PLAYERS
+# active players are paired in a pool of that many worker processes instead:
+# the request returns at once, and a thread waits for the pairings and then
+# commits the round (all at once, as the request would have). If pairing takes
+# longer than PAIRING_TIMEOUT seconds, the round is paired by the fallback
+# (greedy) engine instead.
+#
+# Jobs are kept in the process that started them. Pages waiting for a round
+# poll /api/v1/tournaments/<id>/pairing, which also reports the tournament's
+# current round, so they notice when it's been paired whichever process answers.
+
+log = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    A round being paired in the background. Its state is "running", "done" or
+    "failed" (in which case message says why).
+    """
+
+    def __init__(self, tournament, round_number, engine):
+        self.tournament_id = tournament.id
+        self.version = tournament.version
+        self.round_number = round_number
+        self.engine = engine
+        self.state = "running"
+        self.message = None
+        self.started = monotonic()
+        self.finished = None
+
+    def json(self):
+        return {"round": self.round_number,
+                "state": self.state,
+                "engine": self.engine,
+                "message": self.message,
+                "seconds": round((self.finished or monotonic()) -
+                                 self.started, 3)}
+
+
+# The most recent job for each tournament (by ID), and the pool that they run
+# in (which is only started when first needed).
+jobs = {}
+pool = {}
+lock = Lock()
+
+
+def enabled(player_count):
+    """
+    Returns whether a round with this many players should be paired in the
+    background.
+    """
+    return bool(app.config.get("PAIRING_WORKERS")) and \
+        player_count >= app.config.get("PAIRING_JOB_PLAYERS", 256)
+
+
+def executor(broken=None):
+    """
+    Returns the pool of worker processes, starting it if need be. If given the
+    pool that was found to be broken (because a worker died), it's replaced.
+    """
+    with lock:
+        if broken and pool.get("executor") is broken:
+            del pool["executor"]
+            broken.shutdown(wait=False, cancel_futures=True)
+
+        if "executor" not in pool:
+            # Workers are forked, so that they don't import (and so set up) the
+            # whole app again. They only ever run a pairing engine.
+            pool["executor"] = ProcessPoolExecutor(
+                app.config["PAIRING_WORKERS"], mp_context=get_context("fork"))
+        return pool["executor"]
+
+
+def find(tournament_id):
+    return jobs.get(tournament_id)
+
+
+def start(tournament, round_number, engine, entries, fallback, finish):
+    """
+    Starts pairing the tournament's next round with engine(entries), in a
+    worker process, unless it's already being paired. When the pairings are
+    ready, finish(tournament, pairs) is called (with the tournament freshly
+    loaded, in an app context of its own) to build and commit the round. If
+    they aren't ready within PAIRING_TIMEOUT seconds, or the engine fails,
+    fallback(entries) is used instead. Returns the job.
+    """
+    with lock:
+        job = jobs.get(tournament.id)
+        if job and job.state == "running":
+            return job
+
+        job = jobs[tournament.id] = Job(tournament, round_number,
+                                        engine.__name__)
+
+    workers = executor()
+    try:
+        future = workers.submit(engine, entries)
+    except BrokenProcessPool:
+        workers = executor(broken=workers)
+        future = workers.submit(engine, entries)
+
+    Thread(target=run, args=(job, workers, future, entries, fallback, finish),
+           daemon=True).start()
+    return job
+
+
+def run(job, workers, future, entries, fallback, finish):
+    try:
+        pairs = future.result(timeout=app.config.get("PAIRING_TIMEOUT", 30))
+    except TimeoutError:
+        # The worker can't be stopped, but its pairings will be ignored.
+        log.warning("Pairing round %s of tournament %s timed out. Falling "
+                    "back to %s.", job.round_number, job.tournament_id,
+                    fallback.__name__)
+        job.engine = fallback.__name__
+        pairs = fallback(entries)
+    except Exception as e:
+        log.exception("Pairing round %s of tournament %s failed. Falling "
+                      "back to %s.", job.round_number, job.tournament_id,
+                      fallback.__name__)
+        if isinstance(e, BrokenProcessPool):
+            executor(broken=workers)
+        job.engine = fallback.__name__
+        pairs = fallback(entries)
+
+    with app.app_context():
+        try:
+            tournament = load_tournament(job.tournament_id)
+            if not tournament:
+                raise ValueError("The tournament no longer exists.")
+            if tournament.version != job.version:
+                raise StaleTournament(tournament)
+            finish(tournament, pairs)
+            job.state = "done"
+        except StaleTournament:
+            db.session.rollback()
+            job.state = "failed"
+            job.message = "The tournament was changed while it was being " \
+                          "paired."
+        except Exception as e:
+            log.exception("Unable to save round %s of tournament %s.",
+                          job.round_number, job.tournament_id)
+            db.session.rollback()
+            job.state = "failed"
+            job.message = str(e)
+        finally:
+            job.finished = monotonic()
+            db.session.remove()
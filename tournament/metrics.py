@@ -0,0 +1,309 @@
+from flask import Response
+from sqlalchemy import event, select, func, exists, and_
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, Thread
+from bisect import bisect_left
+from time import perf_counter, sleep
+from json import dumps, loads
+import atexit
+import os
+
+from tournament import app, db
+from tournament.models import Tournament, Round, Match
+
+
+# Counters and histograms for monitoring with Prometheus (or anything else that
+# reads its text format), served at /metrics when METRICS is set. Recording a
+# value only means updating a number under a lock, so it doesn't slow down the
+# views that do it.
+#
+# Each server process counts for itself. When there's more than one (e.g. under
+# gunicorn), set METRICS_DIR to a directory that they share: every process
+# writes its counts there every METRICS_FLUSH seconds, and /metrics adds them
+# all up, so it doesn't matter which process answers. (Clear the directory when
+# the server is restarted.)
+
+registry = []
+
+
+class Metric:
+    """
+    A named set of values, one for each combination of label values. Each
+    value is a list of numbers, so that values from different processes can be
+    added together.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = Lock()
+        self.values = {}
+        registry.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {key: list(value) for key, value in self.values.items()}
+
+    def format_labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, escape(v))
+                              for k, v in pairs) + '}'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+                .replace('\n', '\\n')
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            value = self.values.setdefault(key, [0])
+            value[0] += amount
+
+    def samples(self, key, value):
+        yield self.name + '_total' + self.format_labels(key), value[0]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(),
+                 buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, amount, **labels):
+        key = self.key(labels)
+        bucket = bisect_left(self.buckets, amount)
+        with self.lock:
+            # A count for each bucket (and one for +Inf), followed by the sum.
+            value = self.values.get(key)
+            if value is None:
+                value = self.values[key] = [0] * (len(self.buckets) + 2)
+            value[bucket] += 1
+            value[-1] += amount
+
+    @contextmanager
+    def time(self, **labels):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def samples(self, key, value):
+        count = 0
+        for bound, n in zip(self.buckets + ('+Inf',), value):
+            count += n
+            yield (self.name + '_bucket' +
+                   self.format_labels(key, [('le', str(bound))]), count)
+        yield self.name + '_sum' + self.format_labels(key), value[-1]
+        yield self.name + '_count' + self.format_labels(key), count
+
+
+def timed(histogram, **labels):
+    """
+    Decorates a function so that every call to it is timed by the histogram.
+    """
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+seating_seconds = Histogram(
+    'tournament_seating_seconds', 'Time taken to seat the players.')
+pairing_seconds = Histogram(
+    'tournament_pairing_seconds', 'Time taken to pair a round.')
+standings_seconds = Histogram(
+    'tournament_standings_seconds', 'Time taken to compute standings (when '
+    'they are not already cached).', ['backend'])
+standings_lookups = Counter(
+    'tournament_standings_lookups', 'Standings looked up, by whether they '
+    'were cached.', ['result'])
+reports = Counter(
+    'tournament_reports', 'Reports submitted, by kind (a single match or a '
+    'round at once).', ['kind'])
+reported_matches = Counter(
+    'tournament_reported_matches', 'Match results recorded.')
+login_seconds = Histogram(
+    'tournament_login_seconds', 'Time taken to authenticate a user.',
+    ['method'])
+login_failures = Counter(
+    'tournament_login_failures', 'Failed logins.', ['method'])
+db_queries = Counter(
+    'tournament_db_queries', 'Database queries made.')
+conflicts = Counter(
+    'tournament_conflicts', 'Changes rejected because someone else changed '
+    'the tournament at the same time.')
+
+
+def count_query(connection, cursor, statement, parameters, context,
+                executemany):
+    db_queries.inc()
+
+
+def gauges():
+    """
+    Returns the current number of tournaments and rounds in progress, from the
+    database (so they're the same whichever process answers).
+    """
+    unreported = and_(Match.round_id == Round.id,
+                      Match.seat_1_wins + Match.seat_2_wins +
+                      Match.draws == 0)
+    in_progress = select(func.count(Round.id)) \
+        .where(exists().where(unreported)).scalar_subquery()
+    tournaments = select(func.count(Tournament.id)).scalar_subquery()
+    active = select(func.count(func.distinct(Round.tournament_id))) \
+        .where(exists().where(unreported)).scalar_subquery()
+
+    row = db.session.execute(select(tournaments, active, in_progress)).one()
+
+    return [('tournament_tournaments', 'Tournaments in the database.',
+             row[0]),
+            ('tournament_active_tournaments', 'Tournaments with a round in '
+             'progress.', row[1]),
+            ('tournament_active_rounds', 'Rounds with matches still to be '
+             'reported.', row[2])]
+
+
+# Where this process's counts are kept for the others to read, if anywhere.
+flusher = {}
+
+
+def path(pid):
+    return os.path.join(app.config['METRICS_DIR'], '{}.json'.format(pid))
+
+
+def flush():
+    """
+    Writes this process's counts to METRICS_DIR (atomically, so a process
+    reading them never sees half a file).
+    """
+    snapshot = {m.name: [[list(k), v] for k, v in m.snapshot().items()]
+                for m in registry}
+    temporary = path(os.getpid()) + '.tmp'
+    with open(temporary, 'w') as f:
+        f.write(dumps(snapshot))
+    os.replace(temporary, path(os.getpid()))
+
+
+def keep_flushing():
+    while True:
+        sleep(app.config.get('METRICS_FLUSH', 5))
+        flush()
+
+
+def start_flushing():
+    """
+    Starts writing this process's counts to METRICS_DIR in the background
+    (once per process).
+    """
+    if flusher.get('pid') != os.getpid():
+        flusher['pid'] = os.getpid()
+        os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+        Thread(target=keep_flushing, daemon=True).start()
+
+
+def forked():
+    # A forked process starts counting from zero, since whatever it inherited
+    # has already been counted by its parent. (Its locks are new too, in case
+    # another of the parent's threads held one when it forked.)
+    for metric in registry:
+        metric.lock = Lock()
+        metric.values = {}
+
+
+def flush_on_exit():
+    if flusher.get('pid') == os.getpid():
+        flush()
+
+
+def collect():
+    """
+    Returns every metric's values, added up across processes.
+    """
+    totals = {m.name: m.snapshot() for m in registry}
+    directory = app.config.get('METRICS_DIR')
+
+    if directory:
+        for name in os.listdir(directory):
+            if not name.endswith('.json') or name == '{}.json'.format(
+                    os.getpid()):
+                continue
+
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshot = loads(f.read())
+            except (OSError, ValueError):
+                continue
+
+            for metric, values in snapshot.items():
+                if metric not in totals:
+                    continue
+                for key, value in values:
+                    key = tuple(key)
+                    total = totals[metric].get(key)
+                    if total is None or len(total) != len(value):
+                        totals[metric][key] = value
+                    else:
+                        totals[metric][key] = [a + b for a, b in
+                                               zip(total, value)]
+
+    return totals
+
+
+def exposition():
+    """
+    Returns every metric in Prometheus's text format.
+    """
+    lines = []
+    totals = collect()
+
+    for metric in registry:
+        lines.append('# HELP {} {}'.format(metric.name, metric.help))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+        for key, value in sorted(totals[metric.name].items()):
+            for sample, number in metric.samples(key, value):
+                lines.append('{} {}'.format(sample, number))
+
+    for name, help, value in gauges():
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} gauge'.format(name))
+        lines.append('{} {}'.format(name, value))
+
+    return '\n'.join(lines) + '\n'
+
+
+def serve_metrics():
+    return Response(exposition(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+if app.config.get('METRICS', False):
+    event.listen(Engine, 'before_cursor_execute', count_query)
+    app.add_url_rule('/metrics', 'metrics', serve_metrics)
+    os.register_at_fork(after_in_child=forked)
+
+    if app.config.get('METRICS_DIR'):
+        # Processes start flushing when they handle their first request (since
+        # servers may fork after the app is imported).
+        app.before_request(start_flushing)
+        atexit.register(flush_on_exit)
@@ -0,0 +1,202 @@
+from sqlalchemy import inspect, text
+from secrets import token_hex
+
+from tournament import db
+
+
+# The schema's version is kept in a table of its own. New databases are created
+# from the models and marked as being up to date; older ones are brought up to
+# date by running each migration that they haven't had yet, in order.
+schema_version = db.Table('schema_version', db.Column('version', db.Integer))
+
+
+# Each migration is a version number, a description and a function that takes a
+# connection. Migrations work directly in SQL, because the models describe the
+# latest schema (not the one being migrated), and must cope with databases that
+# were created by db.create_all() at any point before they existed.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        return function
+    return register
+
+
+@migration(1, "Keep running result totals on each player")
+def add_tallies(connection):
+    for column in ('match_count', 'match_win_count', 'match_draw_count',
+                   'game_count', 'game_win_count', 'game_draw_count',
+                   'bye_count'):
+        add_column(connection, 'player', column, 'INTEGER DEFAULT 0')
+
+    # The equivalent of Tournament.recount(), for every player at once.
+    either = '(m.seat_1_id = player.id OR m.seat_2_id = player.id)'
+    games = '(m.seat_1_wins + m.seat_2_wins + m.draws)'
+    connection.execute(text('''
+        UPDATE player SET
+            match_count = (SELECT COUNT(*) FROM "match" m
+                           WHERE {either} AND {games} > 0),
+            match_win_count = (SELECT COUNT(*) FROM "match" m
+                               WHERE (m.seat_1_id = player.id AND
+                                      m.seat_1_wins > m.seat_2_wins) OR
+                                     (m.seat_2_id = player.id AND
+                                      m.seat_2_wins > m.seat_1_wins)),
+            match_draw_count = (SELECT COUNT(*) FROM "match" m
+                                WHERE {either} AND {games} > 0 AND
+                                      m.seat_1_wins = m.seat_2_wins),
+            game_count = (SELECT COALESCE(SUM({games}), 0) FROM "match" m
+                          WHERE {either}),
+            game_win_count = (SELECT COALESCE(SUM(CASE
+                                  WHEN m.seat_1_id = player.id
+                                  THEN m.seat_1_wins ELSE m.seat_2_wins END), 0)
+                              FROM "match" m WHERE {either}),
+            game_draw_count = (SELECT COALESCE(SUM(m.draws), 0) FROM "match" m
+                               WHERE {either}),
+            bye_count = (SELECT COUNT(*) FROM "match" m
+                         WHERE {either} AND {games} > 0 AND
+                               (m.seat_1_id IS NULL OR m.seat_2_id IS NULL))
+    '''.format(either=either, games=games)))
+
+
+@migration(2, "Version tournaments for caching")
+def add_version(connection):
+    add_column(connection, 'tournament', 'version', 'INTEGER DEFAULT 0')
+
+
+@migration(3, "Index matches by player and tournament, and players by "
+              "tournament")
+def add_indexes(connection):
+    # Matches didn't used to record their tournament.
+    connection.execute(text('''
+        UPDATE "match" SET tournament_id = (SELECT tournament_id FROM round
+                                            WHERE round.id = "match".round_id)
+        WHERE tournament_id IS NULL
+    '''))
+
+    for name, table, columns in (
+            ('ix_match_seat_1_id', 'match', 'seat_1_id'),
+            ('ix_match_seat_2_id', 'match', 'seat_2_id'),
+            ('ix_match_tournament_id', 'match', 'tournament_id'),
+            ('ix_player_tournament_id_active', 'player',
+             'tournament_id, active'),
+            ('ix_tournament_user_id', 'tournament', 'user_id')):
+        connection.execute(text('CREATE INDEX IF NOT EXISTS {} ON "{}" ({})'
+                                .format(name, table, columns)))
+
+
+@migration(4, "Seed each tournament's random numbers")
+def add_seed(connection):
+    # Existing tournaments are seeded by their IDs (see Tournament.random()).
+    add_column(connection, 'tournament', 'seed', 'INTEGER')
+
+
+@migration(5, "Identify tournaments uniquely in caches")
+def add_token(connection):
+    add_column(connection, 'tournament', 'token', 'VARCHAR(16)')
+
+    ids = connection.execute(text('SELECT id FROM tournament WHERE token IS '
+                                  'NULL')).scalars().all()
+    if ids:
+        connection.execute(text('UPDATE tournament SET token = :token WHERE '
+                                'id = :id'),
+                           [{'id': id, 'token': token_hex(8)} for id in ids])
+
+
+@migration(6, "Store tournaments' users as text, like users' IDs")
+def make_user_id_text(connection):
+    if connection.dialect.name != 'sqlite':
+        connection.execute(text('ALTER TABLE tournament ALTER COLUMN user_id '
+                                'TYPE VARCHAR(64)'))
+        return
+
+    # SQLite can't change a column's type, so the table is rebuilt (as its
+    # documentation recommends) with the IDs it stored as numbers made text.
+    connection.execute(text('''
+        CREATE TABLE tournament_new (
+            id INTEGER NOT NULL,
+            name VARCHAR(64),
+            user_id VARCHAR(64),
+            version INTEGER DEFAULT '0',
+            seed INTEGER,
+            token VARCHAR(16),
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES user (id)
+        )
+    '''))
+    connection.execute(text('''
+        INSERT INTO tournament_new (id, name, user_id, version, seed, token)
+        SELECT id, name, CAST(user_id AS TEXT), version, seed, token
+        FROM tournament
+    '''))
+    connection.execute(text('DROP TABLE tournament'))
+    connection.execute(text('ALTER TABLE tournament_new RENAME TO tournament'))
+    connection.execute(text('CREATE INDEX ix_tournament_name ON tournament '
+                            '(name)'))
+    connection.execute(text('CREATE INDEX ix_tournament_user_id ON tournament '
+                            '(user_id)'))
+
+
+def add_column(connection, table, column, definition):
+    """
+    Adds a column to a table, unless it's already there.
+    """
+    columns = [c['name'] for c in inspect(connection).get_columns(table)]
+    if column not in columns:
+        connection.execute(text('ALTER TABLE "{}" ADD COLUMN {} {}'.format(
+                                table, column, definition)))
+
+
+def latest():
+    return MIGRATIONS[-1][0]
+
+
+def current(connection):
+    """
+    Returns the schema's version, 0 if the database predates migrations, or
+    None if the database is empty.
+    """
+    tables = inspect(connection).get_table_names()
+
+    if 'schema_version' in tables:
+        return connection.execute(schema_version.select()).scalar() or 0
+
+    return 0 if 'tournament' in tables else None
+
+
+def upgrade(log=None):
+    """
+    Brings the database's schema up to date. (This must be called within an
+    application context.) Returns the migrations that were run, as (version,
+    description) pairs.
+    """
+    applied = []
+
+    with db.engine.begin() as connection:
+        version = current(connection)
+
+        if version is None:
+            db.metadata.create_all(connection)
+            connection.execute(schema_version.insert().values(version=latest()))
+            return applied
+
+        if version == 0:
+            schema_version.create(connection, checkfirst=True)
+            connection.execute(schema_version.insert().values(version=0))
+
+        for number, description, function in MIGRATIONS:
+            if number <= version:
+                continue
+
+            if log:
+                log('Migrating to version {}: {}.'.format(number, description))
+
+            function(connection)
+            connection.execute(schema_version.update().values(version=number))
+            applied.append((number, description))
+
+        # Creates any tables that are new since the database was.
+        db.metadata.create_all(connection)
+
+    return applied
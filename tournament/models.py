@@ -1,4 +1,14 @@
 from tournament import app, db
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from random import Random, randrange
+from secrets import token_hex
+
+
+# The minimum match and game win percentage (in hundredths), per the tournament
+# rules.
+FLOOR = 33
 
 
 class User(db.Model):
@@ -30,24 +40,107 @@ class User(db.Model):
         return '<User {}>'.format(self.id)
 
 
+# The columns of each player's running totals (see Match.tally).
+TALLIES = ('match_count', 'match_win_count', 'match_draw_count', 'game_count',
+           'game_win_count', 'game_draw_count', 'bye_count')
+
+
+class StaleTournament(Exception):
+    """
+    Raised when a tournament is changed by one request while another is
+    changing it. (The first to commit wins; the other has to start over.)
+    """
+
+    def __init__(self, tournament):
+        super().__init__("Tournament {} was changed by someone else."
+                         .format(tournament.id))
+        self.tournament = tournament
+
+
 # Each tournament contains a list of players and a number of rounds.
 class Tournament(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), index=True)
-    players = db.relationship('Player', backref='tournament', lazy='dynamic',
+    players = db.relationship('Player', backref='tournament',
+                              order_by='Player.id',
                               cascade='all, delete-orphan')
-    rounds = db.relationship('Round', backref='tournament', lazy='dynamic',
+    rounds = db.relationship('Round', backref='tournament',
+                             order_by='Round.round_number',
                              cascade='all, delete-orphan')
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    user_id = db.Column(db.String(64), db.ForeignKey('user.id'), index=True)
+
+    # Incremented whenever pairings or results change (see touch()).
+    version = db.Column(db.Integer, default=0, server_default='0')
+
+    # Seeds everything random about the tournament (see random()).
+    seed = db.Column(db.Integer, default=lambda: randrange(2 ** 31))
+
+    # Unique to this tournament, even if its ID is later reused (as SQLite does
+    # when the newest tournament is deleted). See key.
+    token = db.Column(db.String(16), default=lambda: token_hex(8))
 
     def __repr__(self):
         return '<Tournament {}>'.format(self.name)
 
+    @property
+    def key(self):
+        """
+        Identifies the tournament in anything cached about it (which may
+        outlive it).
+        """
+        return '{}.{}'.format(self.id, self.token)
+
+    def touch(self):
+        """
+        Marks the tournament's pairings or results as changed, so that anything
+        cached for the previous version (such as standings) is no longer used.
+
+        The version is compared and swapped: if the tournament has changed
+        since it was loaded (because another request, in this process or
+        another, changed it first), StaleTournament is raised, and nothing
+        should be committed. Call this before committing a change.
+        """
+        # The version is claimed before the change itself is flushed, so the
+        # loser of a race finds out here (once the winner has committed)
+        # rather than from a constraint.
+        with db.session.no_autoflush:
+            claimed = db.session.execute(
+                update(Tournament)
+                .where(Tournament.id == self.id,
+                       Tournament.version == self.version)
+                .values(version=Tournament.version + 1)
+                .execution_options(synchronize_session=False)).rowcount
+
+        if not claimed:
+            raise StaleTournament(self)
+
+        set_committed_value(self, 'version', self.version + 1)
+
+    def random(self, purpose):
+        """
+        Returns a random number generator for the given purpose (e.g.
+        "seating"), seeded by the tournament's seed, so that given the same
+        players, the tournament plays out the same way every time. (Pairing
+        after the first round isn't random; it only depends on the results.)
+        """
+        seed = self.seed if self.seed is not None else self.id
+        return Random('{}:{}'.format(seed, purpose))
+
     def current_round(self):
-        if not self.rounds.all(): return None
+        # Rounds are kept in order, so the current round is always the last.
+        return self.rounds[-1] if self.rounds else None
+
+    def recount(self):
+        """
+        Rebuilds every player's running totals from the match table.
+        """
+        for p in self.players:
+            for column in TALLIES:
+                setattr(p, column, 0)
 
-        round_number = max([r.round_number for r in self.rounds])
-        return [r for r in self.rounds if r.round_number == round_number][0]
+        for r in self.rounds:
+            for m in r.matches:
+                m.tally()
 
     def active_players(self):
         return [p for p in self.players if p.active]
@@ -67,7 +160,8 @@ class Round(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'))
     round_number = db.Column(db.Integer)
-    matches = db.relationship('Match', backref='round', lazy='dynamic',
+    matches = db.relationship('Match', backref='round',
+                              order_by='Match.table_number',
                               cascade='all, delete-orphan')
 
     __table_args__ = (db.UniqueConstraint('tournament_id', 'round_number',
@@ -88,7 +182,8 @@ class Round(db.Model):
 # Each match has two players (seats), a table number, and win/loss information.
 class Match(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'))
+    tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'),
+                              index=True)
     round_id = db.Column(db.Integer, db.ForeignKey('round.id'))
     table_number = db.Column(db.Integer)
     draws = db.Column(db.Integer, default=0)
@@ -98,8 +193,8 @@ class Match(db.Model):
                              foreign_keys='[Match.seat_2_id]')
     seat_1_wins = db.Column(db.Integer, default=0)
     seat_2_wins = db.Column(db.Integer, default=0)
-    seat_1_id = db.Column(db.Integer, db.ForeignKey('player.id'))
-    seat_2_id = db.Column(db.Integer, db.ForeignKey('player.id'))
+    seat_1_id = db.Column(db.Integer, db.ForeignKey('player.id'), index=True)
+    seat_2_id = db.Column(db.Integer, db.ForeignKey('player.id'), index=True)
 
     __table_args__ = (db.UniqueConstraint('round_id', 'table_number',
                       name='_round_table_uc'),)
@@ -108,6 +203,7 @@ class Match(db.Model):
                  seat_2_wins=0, draws=0):
         self.seat_1 = seat_1
         self.seat_2 = seat_2
+        self.tournament_id = seat_1.tournament_id if seat_1 else None
         self.table_number = table_number
         self.draws = draws
         self.seat_1_wins = seat_1_wins
@@ -144,6 +240,32 @@ class Match(db.Model):
         else:
             return None
 
+    def tally(self, sign=1):
+        """
+        Adds the result of this match to each player's running totals, or
+        removes it if sign is -1. (Before changing a reported result, the old
+        result must be removed first.) Unreported matches don't count.
+        """
+        if not self.reported():
+            return
+
+        for p in (self.seat_1, self.seat_2):
+            if p is None:
+                continue
+
+            p.match_count += sign
+            p.game_count += sign * self.games()
+            p.game_win_count += sign * self.wins(p)
+            p.game_draw_count += sign * self.draws
+
+            if self.winner() is p:
+                p.match_win_count += sign
+            elif self.is_draw():
+                p.match_draw_count += sign
+
+            if self.is_bye():
+                p.bye_count += sign
+
     # When reporting results, if seat_2 is null, we set seat_1_wins to 2.
     # (This is a bye.)
 
@@ -156,6 +278,20 @@ class Player(db.Model):
     seat = db.Column(db.Integer, default=0)
     tournament_id = db.Column(db.Integer, db.ForeignKey('tournament.id'))
 
+    # Also serves lookups by tournament alone.
+    __table_args__ = (db.Index('ix_player_tournament_id_active',
+                               'tournament_id', 'active'),)
+
+    # Running totals of the player's reported results, kept up to date by
+    # Match.tally() so that standings don't have to scan every match.
+    match_count = db.Column(db.Integer, default=0, server_default='0')
+    match_win_count = db.Column(db.Integer, default=0, server_default='0')
+    match_draw_count = db.Column(db.Integer, default=0, server_default='0')
+    game_count = db.Column(db.Integer, default=0, server_default='0')
+    game_win_count = db.Column(db.Integer, default=0, server_default='0')
+    game_draw_count = db.Column(db.Integer, default=0, server_default='0')
+    bye_count = db.Column(db.Integer, default=0, server_default='0')
+
     def __repr__(self):
         return '<Player {}>'.format(self.name)
 
@@ -165,7 +301,8 @@ class Player(db.Model):
         if not r:
             return None
 
-        m = [m for m in r.matches if m.seat_1 is self or m.seat_2 is self]
+        # A player has far fewer matches than a round does.
+        m = [m for m in self.matches() if m.round is r]
 
         if (len(m) != 1):
             return None
@@ -190,30 +327,28 @@ class Player(db.Model):
                 self.matches()]
 
     def total_matches(self):
-        count = len(self.matches())     # Includes the current match.
-        if self.current_match() and not self.current_match().reported():
-            count -= 1
-        return count
+        # Only reported matches are counted.
+        return self.match_count
 
     def total_games(self):
-        return sum([m.games() for m in self.matches()])
+        return self.game_count
 
     def byes(self):
-        return len([m for m in self.matches() if m.is_bye()])
+        return self.bye_count
 
     def match_wins(self):
         # Assumes that byes are properly recorded as a 2-game match win.
-        return len([m for m in self.matches() if m.winner() is self])
+        return self.match_win_count
 
     def game_wins(self):
         # Assumes that byes are properly recorded as a 2-game match win.
-        return sum([m.wins(self) for m in self.matches()])
+        return self.game_win_count
 
     def match_draws(self):
-        return len([m for m in self.matches() if m.is_draw()])
+        return self.match_draw_count
 
     def game_draws(self):
-        return sum([m.draws for m in self.matches()])
+        return self.game_draw_count
 
     def match_points(self):
         # Assumes that byes are properly recorded as a 2-game match win.
@@ -224,32 +359,20 @@ class Player(db.Model):
         return (3 * self.game_wins()) + self.game_draws()
 
     def match_win_percentage(self):
-        if self.total_matches() == 0:
-            percent = 0.33
-        else:
-            percent = self.match_points() / (3.0 * self.total_matches())
-        return max(round(percent, 2), 0.33)
+        return percentage(self.match_points(), 3 * self.total_matches())
 
     def game_win_percentage(self):
-        if self.total_games() == 0:
-            percent = 0.33
-        else:
-            percent = self.game_points() / (3.0 * self.total_games())
-        return max(round(percent, 2), 0.33)
+        return percentage(self.game_points(), 3 * self.total_games())
 
     def op_match_win_percentage(self):
         # BYES are ignored for opponents' records.
-        opponents = [o.match_win_percentage() for o in self.opponents() if o]
-        if not opponents:
-            return 0.33
-        return round(sum(opponents) / len(opponents), 2)
+        return average([o.match_win_percentage() for o in self.opponents()
+                        if o])
 
     def op_game_win_percentage(self):
         # BYES are ignored for opponents' records.
-        opponents = [o.game_win_percentage() for o in self.opponents() if o]
-        if not opponents:
-            return 0.33
-        return round(sum(opponents) / len(opponents), 2)
+        return average([o.game_win_percentage() for o in self.opponents()
+                        if o])
 
     def points(self):
         return self.match_points()
@@ -269,3 +392,99 @@ class Player(db.Model):
     def paired(self):
         return self.opponent() is not None
 
+
+def hundredths(numerator, denominator):
+    """
+    Returns numerator / denominator in hundredths, rounded to the nearest
+    hundredth (halves round up). The arithmetic is exact, so the result doesn't
+    depend on floating point error (or on the order in which things were added
+    up), and can be reproduced in SQL.
+    """
+    return (200 * numerator + denominator) // (2 * denominator)
+
+
+def percentage(points, possible):
+    """
+    A match or game win percentage, rounded to two decimal places and no lower
+    than the floor.
+    """
+    if possible == 0:
+        return FLOOR / 100
+    return max(hundredths(points, possible), FLOOR) / 100
+
+
+def average(percentages):
+    """
+    Averages opponents' win percentages (each of which is already rounded to
+    two decimal places), rounding the result in the same way.
+    """
+    if not percentages:
+        return FLOOR / 100
+    return hundredths(sum(round(p * 100) for p in percentages),
+                      100 * len(percentages)) / 100
+
+
+def load_tournament(id):
+    """
+    Loads a tournament along with all of its players, rounds and matches, using
+    a fixed number of queries (one per table, plus one for each side of the
+    player/match relationship). Every relationship between the loaded objects
+    is then resolved from the session's identity map, so the helper methods
+    above don't issue any further queries.
+    """
+    return Tournament.query.options(
+        selectinload(Tournament.players).selectinload(Player.matches_1),
+        selectinload(Tournament.players).selectinload(Player.matches_2),
+        selectinload(Tournament.rounds).selectinload(Round.matches),
+    ).filter_by(id=id).first()
+
+
+def tournament_page(user_id=None, search=None, before=None, after=None,
+                    size=25):
+    """
+    Returns a page of tournaments (newest first) for the tournament list, in a
+    single query, without loading any players or rounds. Each row has the
+    tournament's id, name, user_id and number of players and rounds. Pages are
+    found by ID (before or after the ID of the last or first row on the page
+    next to it), so every page is as fast to find as the first. Tournaments are
+    limited to those of the given user (if any) and to those whose names
+    contain the search text (if any).
+
+    Returns the rows, along with the IDs to use to find the older and newer
+    pages (or None where there isn't one).
+    """
+    rounds = select(func.count(Round.id)) \
+             .where(Round.tournament_id == Tournament.id).scalar_subquery()
+
+    query = db.session.query(
+        Tournament.id, Tournament.name, Tournament.user_id,
+        func.count(Player.id).label('players'), rounds.label('rounds')
+    ).outerjoin(
+        Player, Player.tournament_id == Tournament.id
+    ).group_by(Tournament.id)
+
+    if user_id is not None:
+        query = query.filter(Tournament.user_id == user_id)
+
+    if search:
+        query = query.filter(func.lower(Tournament.name)
+                             .contains(search.lower(), autoescape=True))
+
+    # One more row than needed is fetched, to see whether there's another page.
+    if after is not None:
+        query = query.filter(Tournament.id > after).order_by(Tournament.id)
+        rows = query.limit(size + 1).all()
+        newer = rows[size - 1].id if len(rows) > size else None
+        rows = rows[:size][::-1]
+        older = rows[-1].id if rows else None
+    else:
+        if before is not None:
+            query = query.filter(Tournament.id < before)
+        query = query.order_by(Tournament.id.desc())
+        rows = query.limit(size + 1).all()
+        older = rows[size - 1].id if len(rows) > size else None
+        rows = rows[:size]
+        newer = rows[0].id if rows and before is not None else None
+
+    return rows, older, newer
+
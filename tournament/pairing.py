@@ -0,0 +1,553 @@
+from collections import namedtuple
+
+
+# A snapshot of one player's standing, as far as pairing is concerned. Entries
+# are passed to the pairing engines in rank order (best player first), and
+# opponents is a set of the IDs of every player already faced.
+Entry = namedtuple('Entry', ['id', 'points', 'opponents', 'byes'])
+
+
+# Each player is initially only considered against this many players ranked
+# directly below them. (If that doesn't produce a pairing for everyone, the
+# window is widened, four times over each time, until it does or until every
+# possible opponent is considered.)
+WINDOW = 32
+
+
+def pair_round(entries, window=WINDOW):
+    """
+    Pairs players by maximum weight matching. Every pair of players who haven't
+    played each other is a candidate, weighted so that the matching minimizes
+    the (squared) point difference between opponents, then the difference in
+    rank. If there is an odd number of players, a BYE is added as an extra
+    player with zero points ranked below everyone, which only players who
+    haven't had a BYE may be paired with.
+
+    Returns a list of (player, opponent) ID pairs in table order, where the
+    opponent is None for a BYE.
+    """
+    n = len(entries)
+    if not n:
+        return []
+
+    # The BYE (if there is one) is vertex n.
+    vertices = n + (n % 2)
+    points = [e.points for e in entries] + [0]
+
+    # Point differences always outweigh any possible difference in rank.
+    scale = vertices * vertices
+
+    # Distance from the BYE counts double, so that (all else being equal) it
+    # goes to the lowest ranked player who can have it: moving it up a place
+    # can't save more than a place's distance between the other players.
+    def cost(i, j):
+        return (points[i] - points[j]) ** 2 * scale + \
+            abs(i - j) * (2 if j == n else 1)
+
+    def candidates(limit):
+        edges = []
+        for i in range(n):
+            for j in range(i + 1, min(n, i + 1 + limit)):
+                if entries[j].id not in entries[i].opponents:
+                    edges.append((i, j, cost(i, j)))
+            if vertices > n and not entries[i].byes:
+                edges.append((i, n, cost(i, n)))
+        return edges
+
+    edges = candidates(window)
+    mate = match_edges(edges, vertices)
+
+    # If anyone (the BYE included) is left unmatched, the window may have been
+    # too narrow to find them a new opponent. Widening it gradually usually
+    # finds one long before the whole field (n^2 / 2 edges) has to be matched.
+    while -1 in mate and window < n:
+        window *= 4
+        edges = candidates(window)
+        mate = match_edges(edges, vertices)
+
+    tables = []
+    for i in range(n):
+        if mate[i] == n:
+            tables.append((i, None))
+        elif mate[i] == -1:
+            # There is nobody left that this player hasn't already played.
+            tables.append((i, None))
+        elif i < mate[i]:
+            tables.append((i, mate[i]))
+
+    # The top ranked players are seated at the first tables, BYES last.
+    tables.sort(key=lambda t: (t[1] is None, t[0]))
+    return [(entries[i].id, entries[j].id if j is not None else None)
+            for i, j in tables]
+
+
+def greedy(entries):
+    """
+    Pairs each player (in rank order) with the next highest ranked player they
+    haven't already played. Anyone left without an opponent gets a BYE. This is
+    fast, but can result in multiple BYES if the bottom ranked players have
+    already played each other.
+    """
+    tables = []
+    paired = set()
+
+    for i, player in enumerate(entries):
+        if player.id in paired:
+            continue
+
+        for opponent in entries[i + 1:]:
+            if opponent.id not in paired and \
+                    opponent.id not in player.opponents:
+                tables.append((player.id, opponent.id))
+                paired.update((player.id, opponent.id))
+                break
+        else:
+            tables.append((player.id, None))
+            paired.add(player.id)
+
+    return tables
+
+
+# The PAIRING_ENGINE config option selects one of these.
+ENGINES = {'matching': pair_round, 'greedy': greedy}
+
+
+def match_edges(edges, vertices):
+    """
+    Wraps max_weight_matching so that the weights are positive costs to be
+    minimized, and pads the result out to the given number of vertices.
+    """
+    if not edges:
+        return [-1] * vertices
+
+    highest = max(w for i, j, w in edges) + 1
+    mate = max_weight_matching([(i, j, highest - w) for i, j, w in edges])
+    return mate + [-1] * (vertices - len(mate))
+
+
+def max_weight_matching(edges):
+    """
+    Computes a maximum weight matching among all maximum cardinality matchings
+    of a general graph, using Edmonds' blossom algorithm with the primal-dual
+    method, in O(n^3) time. Edges are (i, j, weight) tuples of vertex indices
+    and integer weights. Returns a list giving the vertex each vertex is matched
+    to (or -1).
+
+    This follows "An O(EV log V) algorithm for finding a maximal weighted
+    matching in general graphs" (Galil, Micali and Gabow, 1986) and the
+    well-known reference implementation by Joris van Rantwijk.
+    """
+    if not edges:
+        return []
+
+    nedge = len(edges)
+    nvertex = 1 + max(max(i, j) for i, j, w in edges)
+    max_weight = max(0, max(w for i, j, w in edges))
+
+    # Edge k has endpoints 2k and 2k + 1. endpoint[p] is the vertex to which
+    # endpoint p is attached. neighbend[v] lists the remote endpoints of the
+    # edges attached to v.
+    endpoint = [edges[p // 2][p % 2] for p in range(2 * nedge)]
+    neighbend = [[] for i in range(nvertex)]
+    for k, (i, j, w) in enumerate(edges):
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+
+    # mate[v] is the remote endpoint of v's matched edge, or -1.
+    mate = [-1] * nvertex
+
+    # Vertices and top-level blossoms are labeled S (1), T (2) or free (0).
+    # Indices below nvertex are vertices; the rest are non-trivial blossoms.
+    label = [0] * (2 * nvertex)
+    labelend = [-1] * (2 * nvertex)
+    inblossom = list(range(nvertex))
+    blossomparent = [-1] * (2 * nvertex)
+    blossomchilds = [None] * (2 * nvertex)
+    blossombase = list(range(nvertex)) + [-1] * nvertex
+    blossomendps = [None] * (2 * nvertex)
+    bestedge = [-1] * (2 * nvertex)
+    blossombestedges = [None] * (2 * nvertex)
+    unusedblossoms = list(range(nvertex, 2 * nvertex))
+    dualvar = [max_weight] * nvertex + [0] * nvertex
+    allowedge = [False] * nedge
+    queue = []
+
+    def slack(k):
+        i, j, w = edges[k]
+        return dualvar[i] + dualvar[j] - 2 * w
+
+    def blossom_leaves(b):
+        # Blossoms can be nested very deeply, so they're walked with a stack
+        # (in the same order as recursion would) rather than with recursive
+        # generators, which cost a step per level for every leaf.
+        if b < nvertex:
+            return [b]
+        leaves = []
+        stack = [b]
+        while stack:
+            t = stack.pop()
+            if t < nvertex:
+                leaves.append(t)
+            else:
+                stack.extend(reversed(blossomchilds[t]))
+        return leaves
+
+    def assign_label(w, t, p):
+        # Label w and its top-level blossom, and follow T labels back to the
+        # matched S vertex.
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(blossom_leaves(b))
+        elif t == 2:
+            base = blossombase[b]
+            assign_label(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scan_blossom(v, w):
+        # Traces back from v and w to find either a new blossom (returning its
+        # base) or an augmenting path (returning -1).
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def add_blossom(base, k):
+        # Constructs a new blossom with the given base, containing edge k.
+        v, w, wt = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+
+        for v in blossom_leaves(b):
+            if label[inblossom[v]] == 2:
+                queue.append(v)
+            inblossom[v] = b
+
+        # Compute the least-slack edges to neighbouring S blossoms.
+        bestedgeto = [-1] * (2 * nvertex)
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [[p // 2 for p in neighbend[v]]
+                           for v in blossom_leaves(bv)]
+            else:
+                nblists = [blossombestedges[bv]]
+            for nblist in nblists:
+                for k in nblist:
+                    i, j, wt = edges[k]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if bj != b and label[bj] == 1 and \
+                            (bestedgeto[bj] == -1 or
+                             slack(k) < slack(bestedgeto[bj])):
+                        bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+
+        blossombestedges[b] = [k for k in bestedgeto if k != -1]
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
+                bestedge[b] = k
+
+    def expand_blossom(b, endstage):
+        # Expands the given top-level blossom into its sub-blossoms.
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < nvertex:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expand_blossom(s, endstage)
+            else:
+                for v in blossom_leaves(s):
+                    inblossom[v] = s
+
+        # If we expand a T blossom during a stage, its sub-blossoms must be
+        # relabeled.
+        if not endstage and label[b] == 2:
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[blossomendps[b][j - endptrick] ^
+                               endptrick ^ 1]] = 0
+                assign_label(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in blossom_leaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assign_label(v, 2, labelend[v])
+                j += jstep
+
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augment_blossom(b, v):
+        # Swaps matched and unmatched edges along the even-length path from
+        # vertex v to the base of blossom b.
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= nvertex:
+            augment_blossom(t, v)
+
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= nvertex:
+                augment_blossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= nvertex:
+                augment_blossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+
+        # Rotate the sub-blossoms so that the new base is at the front.
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augment_matching(k):
+        # Swaps matched and unmatched edges along the augmenting path through
+        # edge k.
+        v, w, wt = edges[k]
+        for s, p in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= nvertex:
+                    augment_blossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= nvertex:
+                    augment_blossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    # Every edge of maximum weight has zero slack under the initial dual
+    # variables, so a greedy matching on those edges is a valid starting point
+    # (and saves a stage for every edge in it).
+    for k, (i, j, w) in enumerate(edges):
+        if w == max_weight and mate[i] == -1 and mate[j] == -1 and i != j:
+            mate[i] = 2 * k + 1
+            mate[j] = 2 * k
+
+    # Each stage finds an augmenting path (or proves there isn't one).
+    for stage in range(nvertex):
+        label[:] = [0] * (2 * nvertex)
+        bestedge[:] = [-1] * (2 * nvertex)
+        blossombestedges[nvertex:] = [None] * nvertex
+        allowedge[:] = [False] * nedge
+        queue[:] = []
+
+        for v in range(nvertex):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assign_label(v, 1, -1)
+
+        augmented = False
+        while True:
+            while queue and not augmented:
+                v = queue.pop()
+
+                for p in neighbend[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = slack(k)
+                        if kslack <= 0:
+                            allowedge[k] = True
+
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            assign_label(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = scan_blossom(v, w)
+                            if base >= 0:
+                                add_blossom(base, k)
+                            else:
+                                augment_matching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                            bestedge[w] = k
+
+            if augmented:
+                break
+
+            # No augmenting path yet, so update the dual variables. Since we
+            # want a maximum cardinality matching, never stop on a vertex dual
+            # reaching zero unless nothing else is possible.
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+
+            for v in range(nvertex):
+                if label[inblossom[v]] == 0 and bestedge[v] != -1:
+                    d = slack(bestedge[v])
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 2
+                        deltaedge = bestedge[v]
+
+            for b in range(2 * nvertex):
+                if blossomparent[b] == -1 and label[b] == 1 and \
+                        bestedge[b] != -1:
+                    # Integer weights always give an even slack here.
+                    d = slack(bestedge[b]) // 2
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 3
+                        deltaedge = bestedge[b]
+
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1 and \
+                        label[b] == 2 and \
+                        (deltatype == -1 or dualvar[b] < delta):
+                    delta = dualvar[b]
+                    deltatype = 4
+                    deltablossom = b
+
+            if deltatype == -1:
+                deltatype = 1
+                delta = max(0, min(dualvar[:nvertex]))
+
+            for v in range(nvertex):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+
+            if deltatype == 1:
+                break
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                i, j, wt = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                i, j, wt = edges[deltaedge]
+                queue.append(i)
+            elif deltatype == 4:
+                expand_blossom(deltablossom, False)
+
+        if not augmented:
+            break
+
+        # Expand any S blossoms whose dual variables dropped to zero.
+        for b in range(nvertex, 2 * nvertex):
+            if blossomparent[b] == -1 and blossombase[b] >= 0 and \
+                    label[b] == 1 and dualvar[b] == 0:
+                expand_blossom(b, True)
+
+    return [endpoint[p] if p >= 0 else -1 for p in mate]
@@ -0,0 +1,106 @@
+from sqlalchemy import select
+
+from tournament import app, db
+from tournament.cache import LRUCache
+from tournament.models import Match, Round
+
+
+# Who has already played whom, for pairing (which mustn't pair a rematch) and
+# for editing pairings (which warns about one). The index for each tournament
+# is built from the match table the first time it's needed, and after that only
+# the matches of each new round are added to it, so it's never rebuilt from the
+# players' matches.
+#
+# Only rounds before the one being paired or edited count, so editing the
+# current round's pairings never changes the index. (Earlier rounds can't be
+# edited.)
+
+
+class Rematches:
+    """
+    An index of the pairs of players who have played each other, with one bit
+    for each pair (so 5,000 players take about 1.5MB). Players are identified
+    by their IDs, which are given when the index is created. The BYE (None)
+    has never played anyone.
+    """
+
+    def __init__(self, ids):
+        self.position = {id: i for i, id in enumerate(sorted(ids))}
+        n = len(self.position)
+        self.bits = bytearray((n * (n - 1) // 2 + 7) // 8)
+
+        # The rounds whose matches have been added (1 to round_number).
+        self.round_number = 0
+
+    def bit(self, a, b):
+        i = self.position.get(a)
+        j = self.position.get(b)
+        if i is None or j is None or i == j:
+            return None
+
+        # Only one bit is kept for each pair, in a triangle below the
+        # diagonal.
+        if i < j:
+            i, j = j, i
+        return i * (i - 1) // 2 + j
+
+    def add(self, a, b):
+        k = self.bit(a, b)
+        if k is not None:
+            self.bits[k >> 3] |= 1 << (k & 7)
+
+    def played(self, a, b):
+        k = self.bit(a, b)
+        return k is not None and bool(self.bits[k >> 3] >> (k & 7) & 1)
+
+    def opponents(self, id):
+        return Opponents(self, id)
+
+
+class Opponents:
+    """
+    One player's opponents, according to the index. Can stand in for a set of
+    their IDs (e.g. in an Entry), since it supports the in operator.
+    """
+
+    __slots__ = ('rematches', 'id')
+
+    def __init__(self, rematches, id):
+        self.rematches = rematches
+        self.id = id
+
+    def __contains__(self, other):
+        return self.rematches.played(self.id, other)
+
+
+indexes = LRUCache(app.config.get('REMATCH_CACHE_SIZE', 32))
+
+
+def rematches(tournament, before):
+    """
+    Returns the index of who has played whom in the tournament's rounds
+    numbered lower than before, adding any rounds it's missing.
+    """
+    # Keyed like anything else cached about the tournament, so that an index
+    # is never used for another tournament that reuses its ID.
+    index = indexes.get(tournament.key)
+
+    # A new index is needed if the tournament's players have changed, or if it
+    # already has rounds that shouldn't count.
+    if index is None or index.round_number >= before or \
+            len(index.position) != len(tournament.players) or \
+            any(p.id not in index.position for p in tournament.players):
+        index = Rematches(p.id for p in tournament.players)
+
+    if index.round_number < before - 1:
+        for a, b in db.session.execute(
+                select(Match.seat_1_id, Match.seat_2_id)
+                .join(Round, Match.round_id == Round.id)
+                .where(Match.tournament_id == tournament.id,
+                       Round.round_number > index.round_number,
+                       Round.round_number < before)):
+            index.add(a, b)
+        index.round_number = before - 1
+
+    indexes.set(tournament.key, index)
+    return index
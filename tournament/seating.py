@@ -0,0 +1,106 @@
+from math import ceil
+
+
+# Players are seated at draft tables ("pods") before the first round. The
+# number of tables is worked out directly from the number of players, and
+# players are spread across them as evenly as possible, so that no two tables
+# differ in size by more than one player (e.g. 7, 7 and 6, rather than 9, 9
+# and 2).
+
+
+def number_of_tables(player_count, ideal=8, smallest=None, largest=None):
+    """
+    Returns the number of tables that makes the average table closest in size
+    to the ideal. If given, every table will seat at least smallest and at most
+    largest players, where that's possible. (Where it isn't, tables are kept
+    no larger than largest.)
+    """
+    if player_count <= 0:
+        return 0
+
+    # The best number of tables is one of the two either side of the exact
+    # (fractional) number.
+    fewer = max(player_count // ideal, 1)
+    more = fewer + 1
+    tables = min((fewer, more), key=lambda t: abs(player_count / t - ideal))
+
+    least = ceil(player_count / largest) if largest else 1
+    most = player_count // smallest if smallest else player_count
+
+    return max(min(tables, most), least, 1)
+
+
+def table_sizes(player_count, table_count):
+    """
+    Returns the size of each table, largest first, when the players are spread
+    as evenly as possible.
+    """
+    if not table_count:
+        return []
+
+    size, larger = divmod(player_count, table_count)
+    return [size + 1] * larger + [size] * (table_count - larger)
+
+
+def seat(players, ideal=8, smallest=None, largest=None):
+    """
+    Assigns each player (in the order given) to a table and seat. Returns a
+    list of (player, table, seat) triples, with tables and seats numbered from
+    one.
+    """
+    sizes = table_sizes(len(players), number_of_tables(
+                        len(players), ideal, smallest, largest))
+
+    seats = []
+    for table, size in enumerate(sizes, 1):
+        for seat in range(1, size + 1):
+            seats.append((players[len(seats)], table, seat))
+
+    return seats
+
+
+def pair_by_seat(players):
+    """
+    Pairs the first round from the players' seats (any objects with table and
+    seat attributes). For each draft table, players are paired as far as
+    possible. Then any leftover players are paired together between tables.
+    Then, if anyone is left, that player gets a BYE. Returns a list of (player,
+    opponent) pairs in table order, where the opponent is None for a BYE.
+    """
+    pairs = []
+    unpaired = []
+
+    tables = {}
+    for p in players:
+        tables.setdefault(p.table, []).append(p)
+
+    for table in sorted(tables):
+        current = sorted(tables[table], key=lambda p: p.seat)
+        player_count = len(current)
+
+        if player_count % 2 != 0:
+            # The player in the last seat is not paired at this table.
+            unpaired.append(current[player_count - 1])
+            player_count -= 1
+
+        # Each player will face an opponent halfway around their table.
+        for i in range(player_count // 2):
+            pairs.append((current[i], current[i + player_count // 2]))
+
+    # Pair any players that couldn't be paired with their own draft tables.
+    player_count = len(unpaired)
+    bye = None
+
+    if player_count % 2 != 0:
+        # If there is an odd number of players, someone has a BYE.
+        bye = unpaired[player_count - 1]
+        player_count -= 1
+
+    for i in range(player_count // 2):
+        pairs.append((unpaired[i], unpaired[i + player_count // 2]))
+
+    if bye is not None:
+        pairs.append((bye, None))
+
+    return pairs
+
@@ -0,0 +1,214 @@
+from collections import namedtuple
+from sqlalchemy import select, union_all, literal, case, and_, func
+
+from tournament import app, db
+from tournament.cache import create_cache
+from tournament.models import Match, Player, FLOOR, average
+from tournament.metrics import standings_seconds, standings_lookups
+
+
+# Standings are cached for each version of each tournament.
+cache = create_cache(app.config.get('STANDINGS_CACHE'),
+                     app.config.get('STANDINGS_CACHE_SIZE', 128))
+
+
+class Standing(namedtuple('Standing', ['player', 'points',
+                                       'match_win_percentage',
+                                       'game_win_percentage',
+                                       'op_match_win_percentage',
+                                       'op_game_win_percentage',
+                                       'opponents', 'byes'])):
+    """
+    One row of the standings table. The tiebreakers are exposed under the same
+    names that Player uses. Opponents is a tuple of the IDs of every player
+    faced (including in the current round).
+    """
+
+    @property
+    def tb_1(self):
+        return self.op_match_win_percentage
+
+    @property
+    def tb_2(self):
+        return self.game_win_percentage
+
+    @property
+    def tb_3(self):
+        return self.op_game_win_percentage
+
+
+def get_standings(tournament):
+    """
+    Returns the tournament's standings, as compute_standings() does, but only
+    computes them once for each version of the tournament.
+    """
+    key = 'standings:{}:{}'.format(tournament.key, tournament.version)
+    rows = cache.get(key)
+
+    if rows is None:
+        standings_lookups.inc(result='miss')
+        backend = app.config.get('STANDINGS_BACKEND', 'python')
+        with standings_seconds.time(backend=backend):
+            standings = BACKENDS[backend](tournament)
+        cache.set(key, [[s.player.id] + list(s[1:]) for s in standings])
+        return standings
+
+    standings_lookups.inc(result='hit')
+    players = {p.id: p for p in tournament.players}
+    return [Standing(players[r[0]], *r[1:-2], tuple(r[-2]), r[-1])
+            for r in rows]
+
+
+def compute_standings(tournament):
+    """
+    Computes points and tiebreakers for every player in the tournament at once
+    and returns a list of Standing rows in rank order. Each player's own record
+    comes from their running totals, and each player's win percentages are
+    only computed once, no matter how many opponents they've had.
+    """
+    players = list(tournament.players)
+    index = {p.id: i for i, p in enumerate(players)}
+    n = len(players)
+
+    # Opponents are kept in the same order as Player.opponents().
+    opponents = [[index[o.id] for o in p.opponents() if o] for p in players]
+
+    points = [p.match_points() for p in players]
+    mwp = [p.match_win_percentage() for p in players]
+    gwp = [p.game_win_percentage() for p in players]
+    omwp = [average([mwp[o] for o in opponents[i]]) for i in range(n)]
+    ogwp = [average([gwp[o] for o in opponents[i]]) for i in range(n)]
+
+    standings = [Standing(players[i], points[i], mwp[i], gwp[i], omwp[i],
+                          ogwp[i], tuple(players[o].id for o in opponents[i]),
+                          players[i].byes()) for i in range(n)]
+    return sorted(standings, key=rank, reverse=True)
+
+
+def query_standings(tournament):
+    """
+    Computes the same standings as compute_standings(), but has the database do
+    the work, in two queries: one for every player's record, percentages and
+    tiebreakers (in rank order), and one for everyone's opponents. Percentages
+    are worked out in hundredths with integer arithmetic, exactly as
+    models.hundredths() does, so the results are identical.
+    """
+    match, player = Match.__table__, Player.__table__
+
+    # Each match appears once for each of its players, from their side.
+    seats = union_all(*[
+        select(match.c[mine + '_id'].label('player_id'),
+               match.c[theirs + '_id'].label('opponent_id'),
+               match.c[mine + '_wins'].label('wins'),
+               match.c[theirs + '_wins'].label('losses'),
+               match.c.draws,
+               match.c.id.label('match_id'),
+               literal(seat).label('seat'))
+        .where(match.c.tournament_id == tournament.id,
+               match.c[mine + '_id'].isnot(None))
+        for seat, mine, theirs in ((1, 'seat_1', 'seat_2'),
+                                   (2, 'seat_2', 'seat_1'))
+    ]).cte('seats')
+
+    games = seats.c.wins + seats.c.losses + seats.c.draws
+    reported = games > 0
+
+    def count(condition):
+        return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+    def total(column):
+        return func.coalesce(func.sum(column), 0)
+
+    records = select(
+        player.c.id.label('player_id'),
+        count(reported).label('matches'),
+        count(seats.c.wins > seats.c.losses).label('match_wins'),
+        count(and_(reported, seats.c.wins == seats.c.losses))
+            .label('match_draws'),
+        total(games).label('games'),
+        total(seats.c.wins).label('game_wins'),
+        total(seats.c.draws).label('game_draws'),
+        count(and_(reported, seats.c.opponent_id.is_(None))).label('byes'),
+    ).select_from(
+        player.outerjoin(seats, seats.c.player_id == player.c.id)
+    ).where(
+        player.c.tournament_id == tournament.id
+    ).group_by(player.c.id).cte('records')
+
+    points = 3 * records.c.match_wins + records.c.match_draws
+    game_points = 3 * records.c.game_wins + records.c.game_draws
+
+    percentages = select(
+        records.c.player_id,
+        points.label('points'),
+        percentage(points, 3 * records.c.matches).label('mwp'),
+        percentage(game_points, 3 * records.c.games).label('gwp'),
+        records.c.byes,
+    ).cte('percentages')
+
+    opponent = percentages.alias('opponent')
+    opponents = select(
+        seats.c.player_id,
+        func.sum(opponent.c.mwp).label('mwp'),
+        func.sum(opponent.c.gwp).label('gwp'),
+        func.count().label('count'),
+    ).select_from(
+        seats.join(opponent, opponent.c.player_id == seats.c.opponent_id)
+    ).group_by(seats.c.player_id).cte('opponents')
+
+    omwp = case((opponents.c.count.is_(None), FLOOR),
+                else_=hundredths(opponents.c.mwp,
+                                   100 * opponents.c.count))
+    ogwp = case((opponents.c.count.is_(None), FLOOR),
+                else_=hundredths(opponents.c.gwp,
+                                   100 * opponents.c.count))
+
+    rows = db.session.execute(
+        select(percentages.c.player_id, percentages.c.points,
+               percentages.c.mwp, percentages.c.gwp, omwp.label('omwp'),
+               ogwp.label('ogwp'), percentages.c.byes)
+        .select_from(percentages.outerjoin(
+            opponents, opponents.c.player_id == percentages.c.player_id))
+        .order_by(percentages.c.points.desc(), omwp.desc(),
+                  percentages.c.gwp.desc(), ogwp.desc(),
+                  percentages.c.player_id)
+    ).all()
+
+    faced = {}
+    for player_id, opponent_id in db.session.execute(
+            select(seats.c.player_id, seats.c.opponent_id)
+            .where(seats.c.opponent_id.isnot(None))
+            .order_by(seats.c.seat, seats.c.match_id)):
+        faced.setdefault(player_id, []).append(opponent_id)
+
+    players = {p.id: p for p in tournament.players}
+    return [Standing(players[id], points, mwp / 100, gwp / 100, omwp / 100,
+                     ogwp / 100, tuple(faced.get(id, ())), byes)
+            for id, points, mwp, gwp, omwp, ogwp, byes in rows]
+
+
+def hundredths(numerator, denominator):
+    """
+    The SQL equivalent of models.hundredths(), for non-negative integers.
+    """
+    return (200 * numerator + denominator) // (2 * denominator)
+
+
+def percentage(points, possible):
+    """
+    The SQL equivalent of models.percentage(), in hundredths.
+    """
+    value = hundredths(points, func.nullif(possible, 0))
+    return case((possible == 0, FLOOR), (value < FLOOR, FLOOR), else_=value)
+
+
+def rank(s):
+    """
+    A key function that allows standings to be sorted in rank order: by
+    points, then by each tiebreaker in turn.
+    """
+    return (s.points, s.tb_1, s.tb_2, s.tb_3)
+
+
+# How standings are computed, by the name used in the STANDINGS_BACKEND setting.
+BACKENDS = {'python': compute_standings, 'sql': query_standings}
@@ -0,0 +1,133 @@
+// Keeps pairing and standings tables up to date without reloading the page.
+// A table opts in with data-live ("pairings" or "standings"), data-events (the
+// tournament's event stream) and data-source (the matching JSON API resource).
+//
+// Events carry only what changed, which is applied to the table in place where
+// it can be. The whole resource is only reloaded when that isn't enough: after
+// a "refresh" (when events may have been missed), and for standings whenever
+// results or pairings change, since every player's tiebreakers depend on their
+// opponents' records.
+
+function cell(text, cls) {
+  return $('<td>').text(text).addClass(cls || '');
+}
+
+function pairingRow(m) {
+  return $('<tr>').attr('data-table', m.table).append(
+    cell(m.table),
+    cell(m.seat_1.name),
+    m.seat_2 ? cell(m.seat_2.name) : cell('–BYE–', 'bye')
+  );
+}
+
+function pairingRows(data) {
+  return data.pairings.map(pairingRow);
+}
+
+function standingRows(data) {
+  return data.standings.map(function(s) {
+    return $('<tr>').attr('data-player', s.player.id).append(
+      cell(s.rank),
+      cell(s.player.name),
+      cell(s.points),
+      cell(s.tb_1.toFixed(2)),
+      cell(s.tb_2.toFixed(2)),
+      cell(s.tb_3.toFixed(2)),
+      cell(s.player.active ? '' : 'D', 'dropped')
+    );
+  });
+}
+
+function showRound(table, round) {
+  table.data('round', round);
+  $('h1').text('Round ' + round);
+}
+
+// A new round replaces the table. Otherwise, only the matches that changed
+// (and any that were removed) are replaced, and the tables are kept in order.
+function updatePairings(table, data) {
+  const rows = table.find('tr').slice(1);
+
+  if (data.round !== table.data('round')) {
+    rows.remove();
+    table.append(pairingRows(data));
+    showRound(table, data.round);
+    return;
+  }
+
+  (data.removed || []).forEach(function(number) {
+    rows.filter('[data-table="' + number + '"]').remove();
+  });
+
+  data.pairings.forEach(function(m) {
+    const row = pairingRow(m);
+    const old = table.find('tr[data-table="' + m.table + '"]');
+    if (old.length) {
+      old.replaceWith(row);
+      return;
+    }
+
+    const after = table.find('tr[data-table]').filter(function() {
+      return $(this).data('table') > m.table;
+    }).first();
+    if (after.length) {
+      after.before(row);
+    } else {
+      table.append(row);
+    }
+  });
+}
+
+function updateStandings(table, data) {
+  table.find('tr[data-player="' + data.player.id + '"] .dropped')
+       .text(data.player.active ? '' : 'D');
+}
+
+function live() {
+  $('table[data-live]').each(function() {
+    const table = $(this);
+    const pairings = table.data('live') === 'pairings';
+    let pending = null;
+
+    // Reloads often follow bursts of changes (a whole round being reported),
+    // so wait a moment and then reload the table once.
+    function reload() {
+      clearTimeout(pending);
+      pending = setTimeout(function() {
+        $.getJSON(table.data('source'), function(data) {
+          table.find('tr').slice(1).remove();
+          if (pairings) {
+            table.append(pairingRows(data));
+            showRound(table, data.round);
+          } else {
+            table.append(standingRows(data));
+          }
+        });
+      }, 250);
+    }
+
+    function apply(update) {
+      return function(event) {
+        update(table, JSON.parse(event.data));
+      };
+    }
+
+    if (!window.EventSource) {
+      return;
+    }
+
+    const events = new EventSource(table.data('events'));
+    events.addEventListener('refresh', reload);
+
+    if (pairings) {
+      // Results and drops don't change who is seated where.
+      events.addEventListener('pairings', apply(updatePairings));
+    } else {
+      events.addEventListener('pairings', reload);
+      events.addEventListener('results', reload);
+      events.addEventListener('drop', apply(updateStandings));
+    }
+  });
+}
+
+$(document).ready(live);
@@ -2,16 +2,36 @@
 # Attribution-NonCommercial-ShareAlike 3.0 Unported License.                    
 
 
-from flask import render_template, flash, redirect, session, url_for, request, g
+from flask import render_template, flash, redirect, session, url_for, request, \
+    g, jsonify
 from flask_login import login_user, logout_user, current_user, login_required
-from math import floor, ceil
-from random import shuffle
+from math import floor
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import flag_modified
+import logging
 import ldap3
 
 from tournament import app, db, lm
-from tournament.forms import LoginForm, CreateForm, ReportForm
-from tournament.models import User, Tournament, Round, Match, Player
+from tournament.forms import LoginForm, CreateForm, ReportForm, ResultForm, \
+    RoundReportForm
+from tournament.models import User, Tournament, Round, Match, Player, \
+    StaleTournament, load_tournament, tournament_page, TALLIES
 from tournament.authenticate import authenticate
+from tournament.standings import get_standings
+from tournament.pairing import Entry, ENGINES
+from tournament.seating import seat, pair_by_seat
+from tournament.rematches import rematches, indexes
+from tournament.events import publish
+from tournament import archive
+from tournament.api import match_json, player_json
+from tournament.cache import LRUCache
+from tournament import metrics
+from tournament import jobs
+
+
+log = logging.getLogger(__name__)
 
 
 @app.route('/')
@@ -24,18 +44,36 @@ def index():
 @login_required
 def list_tournaments():
     """
-    Lists all tournaments for the user and allows the user to create, delete or
-    resume one.
+    Lists the user's tournaments (a page at a time) and allows the user to
+    create, delete or resume one.
     """
     user = g.user
-    tournaments = User.query.get(user.id).tournaments.order_by(
-                  Tournament.id.desc())
+    page = list_page(user.id)
 
-    if not tournaments:
+    if not page["tournaments"] and not page["search"] and \
+            not page["older"] and not page["newer"]:
         flash("You don't have any active tournaments.")
 
     return render_template("list.html", title="Active Tournaments", user=user,
-                           tournaments=tournaments, round=None, next=None)
+                           round=None, next=None, admin=False, **page)
+
+
+@app.route('/admin/tournaments')
+@login_required
+def admin_tournaments():
+    """
+    Lists every user's tournaments (a page at a time), for administrators.
+    """
+    user = g.user
+
+    if not user.is_admin():
+        flash("You do not have permission to view all tournaments.")
+        return redirect(url_for("index"))
+
+    link = {'url': url_for('list_tournaments'), 'text': 'Back'}
+    return render_template("list.html", title="All Tournaments", user=user,
+                           round=None, next=None, admin=True, link=link,
+                           **list_page())
 
 
 @app.route('/create', methods=['GET', 'POST'])
@@ -48,10 +86,10 @@ def create_tournament():
     form = CreateForm()
 
     if form.is_submitted():
-        print('Create form submitted. Validating...')
+        log.debug('Create form submitted. Validating...')
 
         if form.validate_on_submit():
-            print('Validated. Creating tournament...')
+            log.debug('Validated. Creating tournament...')
 
             tournament = Tournament(name=form.name.data, user_id=g.user.id)
 
@@ -112,6 +150,7 @@ def delete_tournament():
     if tournament:
         db.session.delete(tournament)
         db.session.commit()
+        indexes.delete(tournament.key)
 
         # Verify that the tournament was deleted.
         if Tournament.query.get(id):
@@ -139,7 +178,7 @@ def main_menu():
     Main menu for the tournament.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -174,12 +213,13 @@ def main_menu():
 
 @app.route('/seat')
 @login_required
+@metrics.timed(metrics.seating_seconds)
 def seat_players():
     """
     Seating players assigns a seat and table number to them.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -188,22 +228,22 @@ def seat_players():
         flash("Players have already been seated.")
         return redirect(url_for("view_seats"))
 
+    # Seating is shuffled by the tournament's own seed, so that it can be
+    # reproduced.
     active = tournament.active_players()
-    shuffle(active)
-
-    table_count = number_of_tables(len(active))
-    table_size = int(ceil(float(len(active)) / table_count))
-
-    for t in range(table_count):
-        for s in range(table_size):
-            index = (t * table_size) + s
-            if index < len(active):
-                # Update player objects.
-                print('Index: {}'.format(index))
-                active[index].table = t + 1
-                active[index].seat = s + 1
-            else:
-                break
+    tournament.random("seating").shuffle(active)
+
+    # The tournament is claimed first, so that if anyone else is seating it at
+    # the same time, only one of them writes any seats.
+    tournament.touch()
+
+    # Every player's seat is written in a single (bulk) update.
+    seats = seat(active, app.config.get("IDEAL_TABLE", 8),
+                 app.config.get("MIN_TABLE"), app.config.get("MAX_TABLE"))
+    if seats:
+        db.session.execute(update(Player), [
+            {"id": p.id, "table": table, "seat": number}
+            for p, table, number in seats])
 
     db.session.commit()
     return redirect(url_for("view_seats"))
@@ -216,7 +256,7 @@ def view_seats():
     Displays assigned seating.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -242,6 +282,7 @@ def view_seats():
 
 @app.route('/pair')
 @login_required
+@metrics.timed(metrics.pairing_seconds)
 def pair_players():
     """
     Pairing players adds a round to the tournament and pairs with an opponent.
@@ -249,16 +290,13 @@ def pair_players():
     (unreported players must either report or drop).
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
 
     active = tournament.active_players()
 
-    bye_player = None
-    table = 1
-
     current_round = tournament.current_round()
     first_round = not current_round
     seated = tournament.seated()
@@ -276,108 +314,71 @@ def pair_players():
     if first_round:
         # Begin a new round.
         round = Round(round_number=1)
-        tournament.rounds.append(round)
-
-        # For each draft table, pair players as far as possible. Then pair any
-        # leftover players together between tables. Then, if anyone is left
-        # that player gets a bye.
-
-        unpaired = []
-        draft_tables = [[p for p in active if p.table == t] for t in
-                        {p.table for p in active}]
-        for current in draft_tables:
-            current.sort(key=lambda p: p.seat)
-            player_count = len(current)
-
-            if player_count % 2 != 0:
-                # The player in the last seat is not paired at this table.
-                unpaired.append(current[player_count - 1])
-                player_count -= 1
-
-            # Each player will face an opponent halfway around their table.
-            for i in range(player_count // 2):
-                opponent = current[(i + (player_count // 2)) % player_count]
-
-                match = create_match(current[i], opponent, table)
-                round.matches.append(match)
-                table += 1
-
-        player_count = len(unpaired)
-        # Pair any players that couldn't be paired with their own draft tables.
-        if player_count:
-            if player_count % 2 != 0:
-                # If there is an odd number of players, someone has a bye.
-                bye_player = unpaired[player_count - 1]
-                player_count -= 1
-
-            for i in range(player_count // 2):
-                opponent = unpaired[(i + (player_count // 2)) % player_count]
-
-                match = create_match(unpaired[i], opponent, table)
-                round.matches.append(match)
-                table += 1
-
-            if bye_player:
-                # BYE
-                match = create_match(bye_player, None, table)
-                round.matches.append(match)
+
+        for table, (player, opponent) in enumerate(pair_by_seat(active), 1):
+            round.matches.append(create_match(player, opponent, table))
 
     # Pair based upon points.
     else:
-        active.sort(key=rank, reverse=True)
-
-        # Begin a new round.
-        round = Round(round_number=tournament.current_round().round_number+1)
-        tournament.rounds.append(round)
-
-        # We can't just look at player.opponent() to see if they've been paired
-        # because this round that we're creating doesn't become the "current
-        # round" until it's committed to the DB. Consequently,
-        # player.opponent() won't work. Hence, a list of paired players.
-        paired = []
+        # Rematches are looked up in the tournament's index of who has played
+        # whom (in every round so far).
+        index = rematches(tournament, current_round.round_number + 1)
+        entries = [Entry(s.player.id, s.points, index.opponents(s.player.id),
+                         s.byes)
+                   for s in get_standings(tournament) if s.player.active]
+        engine = ENGINES[app.config.get("PAIRING_ENGINE", "matching")]
+
+        # Large rounds are paired in the background (see jobs).
+        if jobs.enabled(len(entries)):
+            jobs.start(tournament, current_round.round_number + 1, engine,
+                       entries, ENGINES["greedy"], finish_pairing)
+            return redirect(url_for("wait_for_pairings"))
 
         # Each player faces an opponent not previously faced of similar rank.
-        for i in range(len(active)):
-            if active[i] not in paired:
-                for j in range(i + 1, len(active)):
-                    if active[j] not in paired and \
-                            active[j] not in active[i].opponents():
-                        print('Pairing {} with {}.'
-                              .format(active[i], active[j]))
-
-                        match = create_match(active[i], active[j], table)
-
-                        round.matches.append(match)
-                        paired.append(active[i])
-                        paired.append(active[j])
-
-                        table += 1
-                        break
-
-                else:
-                    if active[i] not in paired:
-                        # BYE
-                        print('{} has a BYE.'.format(active[i]))
-                        match = create_match(active[i], None, table)
-                        round.matches.append(match)
-                        table += 1
-                    else:
-                        print('This should never happen.')
-            else:
-                print('{} already has an opponent.'.format(active[i]))
+        round = paired_round(tournament, engine(entries))
 
-        if not paired:
-            print('All players have BYEs. This is unacceptable.')
+        if all(not m.seat_2 for m in round.matches):
+            log.warning('All players have BYEs. This is unacceptable.')
             flash("Unable to pair players with opponents they haven't played. "
                   "Please select Close Tournament.")
             return redirect(url_for('main_menu'))
 
-    db.session.add(round)
-    db.session.commit()
-
+    add_round(tournament, round)
     return redirect(url_for("view_pairs"))
 
 
+@app.route('/pairing')
+@login_required
+def wait_for_pairings():
+    """
+    Waits for a round that's being paired in the background, then shows its
+    pairings.
+    """
+    user = g.user
+    tournament = current_tournament()
+
+    if not tournament:
+        return redirect(url_for("list_tournaments"))
+
+    job = jobs.find(tournament.id)
+    round = tournament.current_round()
+
+    if not job or job.state == "done" or \
+            (round and round.round_number >= job.round_number):
+        return redirect(url_for("view_pairs"))
+
+    if job.state == "failed":
+        flash("Unable to pair round {}: {}".format(job.round_number,
+                                                   job.message))
+        return redirect(url_for("main_menu"))
+
+    title = "Pairing Round {}".format(job.round_number)
+    link = {'url': url_for('main_menu'), 'text': 'Back'}
+    return render_template("waiting.html", title=title, user=user,
+                           round=None, link=link, job=job,
+                           tournament=tournament)
+
+
 @app.route('/view_pairings')
 @login_required
 def view_pairs():
@@ -385,7 +386,7 @@ def view_pairs():
     Displays assigned match pairings.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -398,7 +399,8 @@ def view_pairs():
     matches = sorted(round.matches, key=lambda m: m.table_number)
     link = {'url': url_for('main_menu'), 'text': 'Back'}
     return render_template("pairing.html", title=title, user=user, link=link,
-                           round=round.round_number, matches=matches)
+                           round=round.round_number, matches=matches,
+                           live=tournament.id)
 
 
 @app.route('/edit_pairings')
@@ -409,7 +411,7 @@ def edit_pairings():
     isn't very good.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -450,18 +452,28 @@ def edit_pairings():
                       opponent.name))
                 return redirect(url_for("edit_pairings"))
 
-            # Pair the player and the opponent.
+            # Pair the player and the opponent (even if they've played before,
+            # since the organizer may have a good reason).
             swap_opponents(player, opponent)
 
+            if rematches(tournament, round.round_number).played(player.id,
+                                                                opponent.id):
+                flash("{} and {} have already played each other.".format(
+                      player.name, opponent.name))
+
             # Clear the selected player so that we have a clean display.
             player = None
 
+    # The selected player's previous opponents are marked.
+    played = rematches(tournament, round.round_number).opponents(player.id) \
+        if player else ()
+
     title = "Edit Pairings"
     matches = sorted(round.matches, key=lambda m: m.table_number)
     link = {'url': url_for('main_menu'), 'text': 'Back'}
     return render_template("edit.html", title=title, user=user,
                            round=round.round_number, matches=matches,
-                           player=player, link=link)
+                           player=player, played=played, link=link)
 
 
 @app.route('/report')
@@ -472,7 +484,7 @@ def report_results():
     losses, and draws for all matches in the current round.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -483,9 +495,112 @@ def report_results():
     title = "Report Results"
     round = tournament.current_round()
     matches = sorted(round.matches, key=lambda m: m.table_number)
+
+    # Results for every match (except BYEs) can be entered at once.
+    form = RoundReportForm(results=[{"match": m.id,
+                                     "seat_1": m.seat_1_wins,
+                                     "seat_2": m.seat_2_wins,
+                                     "draws": m.draws}
+                                    for m in matches if m.seat_2])
+    entries = iter(form.results)
+    rows = [(m, next(entries) if m.seat_2 else None) for m in matches]
+
     link = {'url': url_for('main_menu'), 'text': 'Back'}
     return render_template("report.html", title=title, user=user, link=link,
-                           round=round.round_number, matches=matches)
+                           round=round.round_number, rows=rows, form=form)
+
+
+@app.route('/report_round', methods=['POST'])
+@login_required
+def report_round():
+    """
+    Handles the reporting of any number of matches in the current round at
+    once, either from the form on the report page or as JSON:
+
+        {"results": [{"match": 1, "seat_1": 2, "seat_2": 1, "draws": 0}, ...]}
+
+    Nothing is reported unless every result is valid. BYEs are reported
+    automatically.
+    """
+    user = g.user
+    tournament = current_tournament()
+    json = request.is_json
+
+    if not tournament or not tournament.current_round():
+        if json:
+            return jsonify(error="There is no round to report."), 400
+        return redirect(url_for("main_menu"))
+
+    round = tournament.current_round()
+    matches = {str(m.id): m for m in round.matches}
+
+    if json:
+        data = request.get_json(silent=True)
+        reports = data.get("results", []) if isinstance(data, dict) else None
+        if not isinstance(reports, list) or \
+                not all(isinstance(r, dict) for r in reports):
+            return jsonify(error='Results must be given as {"results": '
+                                 '[{"match": ..., "seat_1": ..., "seat_2": '
+                                 '..., "draws": ...}, ...]}.'), 400
+
+        entries = [ResultForm(data=r) for r in reports]
+        valid = all([e.validate() for e in entries])
+    else:
+        form = RoundReportForm()
+        entries = form.results.entries
+        valid = form.validate_on_submit()
+
+    errors = []
+    for e in entries:
+        if e.errors:
+            errors.append({"match": e.match.data, "errors": e.errors})
+        elif str(e.match.data) not in matches:
+            errors.append({"match": e.match.data,
+                           "errors": {"match": ["Not in this round."]}})
+
+    if not valid or errors:
+        if json:
+            return jsonify(errors=errors), 400
+
+        for error in errors:
+            match = matches.get(str(error["match"]))
+            for field, messages in error["errors"].items():
+                flash("Error at table {}: {}".format(
+                      match.table_number if match else "?",
+                      ", ".join(messages)))
+        if not valid and not errors:
+            flash_errors(form)
+        return redirect(url_for("report_results"))
+
+    # Results that are already recorded (e.g. when the form is submitted
+    # again) are left alone, so that they don't change the tournament.
+    results = []
+    for e in entries:
+        match = matches[str(e.match.data)]
+        result = (floor(e.seat_1.data), floor(e.seat_2.data),
+                  floor(e.draws.data))
+        if match.seat_2 and any(result) and result != \
+                (match.seat_1_wins, match.seat_2_wins, match.draws):
+            results.append((match, *result))
+
+    # BYEs get reported automatically.
+    results += [(m, 2, 0, 0) for m in round.matches
+                if not m.seat_2 and not m.reported()]
+
+    if results:
+        tournament, results = commit_results(tournament, results)
+
+        metrics.reports.inc(kind='round')
+        metrics.reported_matches.inc(len(results))
+
+        publish(tournament, "results",
+                {"matches": [match_json(r[0]) for r in results]})
+
+    if json:
+        return jsonify(reported=len(results))
+
+    flash("Reported {} matches.".format(len(results)))
+    return redirect(url_for("report_results"))
 
 
 @app.route('/report_match', methods=['GET', 'POST'])
@@ -495,7 +610,7 @@ def report_match():
     Handles the reporting of a given match.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -507,11 +622,11 @@ def report_match():
     win, loss, draw = 0, 0, 0
 
     if form.is_submitted():
-        print('Report form submitted. Validating...')
+        log.debug('Report form submitted. Validating...')
         match = form.match.data
 
         if form.validate_on_submit():
-            print('Validated. Reporting...')
+            log.debug('Validated. Reporting...')
             win = floor(form.seat_1.data)
             loss = floor(form.seat_2.data)
             draw = floor(form.draws.data)
@@ -521,7 +636,7 @@ def report_match():
     else:
         match = request.args.get("match")
 
-    print('Match: {}'.format(match))
+    log.debug('Match: %s', match)
     if match: match = Match.query.get(match)
 
     round = tournament.current_round()
@@ -536,11 +651,14 @@ def report_match():
 
     # We're doing the actual reporting!
     if win or loss or draw:
-        match.seat_1_wins = win if win else 0
-        match.seat_2_wins = loss if loss else 0
-        match.draws = draw if draw else 0
+        tournament, results = commit_results(tournament,
+                                             [(match, win, loss, draw)])
 
-        db.session.commit()
+        metrics.reports.inc(kind='match')
+        metrics.reported_matches.inc(len(results))
+
+        publish(tournament, "results",
+                {"matches": [match_json(r[0]) for r in results]})
         return redirect(url_for("report_results"))
 
     # No results yet. We're requesting that the user reports!
@@ -560,7 +678,7 @@ def standings():
     Displays current tournament standings.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -570,10 +688,11 @@ def standings():
         round = round.round_number
 
     title = "Standings"
-    players = sorted(tournament.players.all(), key=rank, reverse=True)
+    standings = get_standings(tournament)
     link = {'url': url_for('main_menu'), 'text': 'Back'}
     return render_template("standings.html", title=title, user=user, link=link,
-                           round=round, players=players, close=False)
+                           round=round, standings=standings, close=False,
+                           live=tournament.id)
 
 
 @app.route('/stats')
@@ -583,7 +702,7 @@ def player_stats():
     Displays detailed player stats.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -606,7 +725,7 @@ def player_details():
     Displays detailed stats for a given player.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -650,11 +769,14 @@ def player_details():
 
             match_details.append(details)
 
+    standing = [s for s in get_standings(tournament) if s.player is player][0]
+
     title = "Statistics for {}".format(player.name)
     round = tournament.current_round().round_number
     link = {'url': url_for('player_stats'), 'text': 'Back'}
     return render_template("stats.html", title=title, user=user, round=round,
-                           player=player, matches=match_details, link=link)
+                           player=player, standing=standing,
+                           matches=match_details, link=link)
 
 
 @app.route('/drop')
@@ -664,7 +786,7 @@ def drop_player():
     Drops a player from the tournament.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -680,7 +802,10 @@ def drop_player():
         if not player.current_match() or player.current_match().reported():
             flash("{} dropped.".format(player.name))
             player.active = False
+            tournament.touch()
             db.session.commit()
+
+            publish(tournament, "drop", {"player": player_json(player)})
         else:
             flash("Unable to drop {}: match results must be reported first."
                   .format(player.name))
@@ -710,7 +835,7 @@ def close_tournament():
     Displays final stats, then deletes the tournament.
     """
     user = g.user
-    tournament = g.tournament
+    tournament = current_tournament()
 
     if not tournament:
         return redirect(url_for("list_tournaments"))
@@ -720,10 +845,11 @@ def close_tournament():
 
     title = "Final Standings"
     round = tournament.current_round().round_number
-    players = sorted(tournament.players.all(), key=rank, reverse=True)
+    standings = get_standings(tournament)
     link = {'url': url_for('main_menu'), 'text': 'Cancel'}
     return render_template("standings.html", title=title, user=user, link=link,
-                           round=round, players=players, close=tournament.id)
+                           round=round, standings=standings,
+                           close=tournament.id)
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -764,6 +890,8 @@ def login():
 
 @app.route('/logout')
 def logout():
+    if current_user.is_authenticated:
+        users.delete(current_user.id)
     logout_user()
     return redirect(url_for('index'))
 
@@ -780,25 +908,99 @@ def clear():
     return redirect(url_for('index'))
 
 
+# Users who are logged in are looked up on every request, so their details are
+# kept for a while (USER_CACHE_TTL seconds) rather than queried every time.
+users = LRUCache(app.config.get('USER_CACHE_SIZE', 1024),
+                 app.config.get('USER_CACHE_TTL', 60))
+
+
 @lm.user_loader
 def load_user(id):
-    return User.query.get(id)
+    details = users.get(id)
+
+    if details is None:
+        user = db.session.get(User, id)
+        if user is None:
+            return None
+
+        details = {'id': user.id, 'name': user.name, 'email': user.email}
+        users.set(id, details)
+        return user
+
+    # Adds the user to the session as though they'd been loaded, without a
+    # query, so that (for instance) tournament.user == user still holds.
+    user = User(**details)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
 
 
 @app.before_request
 def before_request():
+    # Requests share g when they're made within an application context (as the
+    # benchmark's are), so the last request's tournament must be forgotten.
+    g.pop("tournament", None)
+
+    # Static files don't need the user or the tournament.
+    if request.endpoint == 'static':
+        return
+
     g.user = current_user
     if "tournament" not in session.keys():
         session["tournament"] = None
-    g.tournament = Tournament.query.get(session["tournament"]) \
-                   if session["tournament"] else None
+
+
+@app.errorhandler(StaleTournament)
+def conflict(error):
+    """
+    Handles a change that lost a race with another (e.g. two judges pairing the
+    same round at once). Nothing is saved, and the user is shown the tournament
+    as it now is, so that they can try again if it still makes sense.
+    """
+    db.session.rollback()
+    metrics.conflicts.inc()
+    log.info('Conflicting change: %s', error)
+
+    message = "Someone else changed this tournament at the same time, so " \
+              "your change wasn't saved. Please check it and try again."
+
+    if request.is_json:
+        return jsonify(error=message), 409
+
+    flash(message)
+    return redirect(url_for("main_menu"))
+
+
+def current_tournament():
+    """
+    Returns the tournament that the user is working on (or None). It's loaded
+    when first needed, at most once per request, so pages that don't need it
+    (like the tournament list and the API) don't pay for loading it.
+    """
+    if "tournament" not in g:
+        id = session.get("tournament")
+        g.tournament = load_tournament(id) if id else None
+    return g.tournament
 
 
 def clear_tournaments():
-    # Cascading wasn't properly deleting players.
-    for t in Tournament.query.all():
-        db.session.delete(t)
-    db.session.commit()
+    # Deleted in bulk, without loading anything. (For a large database, use
+    # manage.py delete, which can also archive the tournaments first.)
+    archive.clear(archive.select_tournaments())
+
+
+def list_page(user_id=None):
+    """
+    Finds the page of tournaments requested by the query string (see
+    tournament_page) and returns it as template arguments.
+    """
+    search = request.args.get("q", "").strip()
+    tournaments, older, newer = tournament_page(
+        user_id, search, before=request.args.get("before", type=int),
+        after=request.args.get("after", type=int),
+        size=app.config.get("LIST_PAGE_SIZE", 25))
+
+    return {"tournaments": tournaments, "search": search, "older": older,
+            "newer": newer}
 
 
 def validate_tournament(id):
@@ -823,15 +1025,67 @@ def validate_tournament(id):
     return None
 
 
-def number_of_tables(player_count):
+def paired_round(tournament, pairs):
     """
-    Players should be seated such that tables have as close to eight players
-    each as possible.
+    Builds (but doesn't add) the tournament's next round from a pairing
+    engine's (player, opponent) ID pairs, in table order.
     """
-    target = app.config["IDEAL_TABLE"]
-    possible_tables = range(1, player_count + 1)
-    diff = [abs(floor(player_count / i) - target) for i in possible_tables]
-    return int(diff.index(min(diff))) + 1
+    round = Round(round_number=tournament.current_round().round_number + 1)
+    players = {p.id: p for p in tournament.active_players()}
+
+    for table, (player, opponent) in enumerate(pairs, 1):
+        if opponent:
+            log.debug('Pairing %s with %s.', players[player],
+                      players[opponent])
+        else:
+            log.debug('%s has a BYE.', players[player])
+
+        round.matches.append(create_match(players[player],
+                                          players.get(opponent), table))
+
+    return round
+
+
+def add_round(tournament, round):
+    """
+    Adds a (complete) round to the tournament, commits it and announces its
+    pairings.
+    """
+    # The round is only attached to the tournament once it's complete, so that
+    # the new matches aren't flushed halfway through pairing.
+    id, number = tournament.id, round.round_number
+    tournament.rounds.append(round)
+    tournament.touch()
+    db.session.add(round)
+
+    # Someone else adding the same round first (despite the version check)
+    # breaks the unique constraint on round numbers, which is a conflict like
+    # any other. Other constraints are errors.
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if Round.query.filter_by(tournament_id=id,
+                                 round_number=number).first():
+            raise StaleTournament(tournament) from e
+        raise
+
+    publish(tournament, "pairings",
+            {"round": round.round_number,
+             "pairings": [match_json(m) for m in round.matches]})
+
+
+def finish_pairing(tournament, pairs):
+    """
+    Adds a round that was paired in the background (see jobs).
+    """
+    round = paired_round(tournament, pairs)
+
+    if all(not m.seat_2 for m in round.matches):
+        raise ValueError("Players can't be paired with opponents they haven't "
+                         "played. Please select Close Tournament.")
+
+    add_round(tournament, round)
 
 
 def create_match(player, opponent, table_number):
@@ -850,6 +1104,86 @@ def create_match(player, opponent, table_number):
     return match
 
 
+def record_results(results):
+    """
+    Takes a list of (match, seat 1 wins, seat 2 wins, draws) and records them,
+    updating the players' running totals.
+    """
+    players = set()
+
+    for match, win, loss, draw in results:
+        match.tally(-1)
+        match.seat_1_wins = win if win else 0
+        match.seat_2_wins = loss if loss else 0
+        match.draws = draw if draw else 0
+        match.tally()
+
+        players.update(p for p in (match.seat_1, match.seat_2) if p)
+
+    # The session only batches together UPDATEs that set the same columns, so
+    # all of them are marked as modified. That way each table is written with a
+    # single executemany, no matter how many matches there are.
+    for match, win, loss, draw in results:
+        for column in ('seat_1_wins', 'seat_2_wins', 'draws'):
+            flag_modified(match, column)
+
+    for p in players:
+        for column in TALLIES:
+            flag_modified(p, column)
+
+
+def commit_results(tournament, results, attempts=3):
+    """
+    Records and commits a list of (match, seat 1 wins, seat 2 wins, draws).
+    Returns the tournament and the results, which are reloaded if they had to
+    be recorded again.
+
+    If someone else changed the tournament first (reporting another table, for
+    instance), the results are recorded again on top of their change, as long
+    as none of these matches was changed. Otherwise, StaleTournament is raised.
+    """
+    # What each match was like, by ID (since its object doesn't survive a
+    # rollback), when the results were given.
+    before = [(match.id, state(match)) for match, *result in results]
+    tournament_id = tournament.id
+
+    for attempt in range(attempts):
+        record_results(results)
+        try:
+            tournament.touch()
+            db.session.commit()
+            return tournament, results
+        except StaleTournament as e:
+            db.session.rollback()
+            stale = e
+
+        if attempt == attempts - 1:
+            raise stale
+
+        tournament = g.tournament = load_tournament(tournament_id)
+        round = tournament.current_round() if tournament else None
+        matches = {m.id: m for m in round.matches} if round else {}
+
+        retry = []
+        for (id, expected), (match, *result) in zip(before, results):
+            match = matches.get(id)
+            if match and state(match) == expected:
+                retry.append(((id, expected), (match, *result)))
+            elif not match or state(match) != expected[:2] + tuple(result):
+                # The match was re-paired, or reported differently.
+                raise stale
+        before = [r[0] for r in retry]
+        results = [r[1] for r in retry]
+
+        if not results:
+            return tournament, results
+
+
+def state(match):
+    return (match.seat_1_id, match.seat_2_id, match.seat_1_wins,
+            match.seat_2_wins, match.draws)
+
+
 def swap_opponents(player_1, opponent_1):
     """
     Takes two players who are already paired with others and pairs them with
@@ -857,10 +1191,15 @@ def swap_opponents(player_1, opponent_1):
     """
     match_1 = player_1.current_match()
     match_2 = opponent_1.current_match()
+    removed = []
 
     player_2 = player_1.opponent()
     opponent_2 = opponent_1.opponent()
 
+    # Any results move with the players, so take them out of the totals first.
+    match_1.tally(-1)
+    match_2.tally(-1)
+
     # Do the swap.
     match_1.seat_1 = player_1
     match_1.seat_2 = opponent_1
@@ -871,16 +1210,30 @@ def swap_opponents(player_1, opponent_1):
     if not match_2.seat_1:
         if match_2.seat_2:
             # If match two has a BYE, ensure that the player is in seat 1.
-            print("The BYE is in seat one. Swapping...")
+            log.debug("The BYE is in seat one. Swapping...")
             match_2.seat_1, match_2.seat_2 = match_2.seat_2, match_2.seat_1
         else:
             # If match two somehow ends up with two BYEs, delete it.
-            print("Both seats have a BYE. Deleting match...")
+            log.debug("Both seats have a BYE. Deleting match...")
+            removed.append(match_2.table_number)
+            match_2.round.matches.remove(match_2)
             db.session.delete(match_2)
             match_2 = None
 
+    match_1.tally()
+    if match_2:
+        match_2.tally()
+
+    player_1.tournament.touch()
     db.session.commit()
 
+    # Only the changed matches are sent, along with the table number of a
+    # deleted match (if there was one).
+    publish(player_1.tournament, "pairings",
+            {"round": match_1.round.round_number,
+             "pairings": [match_json(m) for m in (match_1, match_2) if m],
+             "removed": removed})
+
     flash("{} is now paired with {}.".format(match_1.seat_1.name,
           match_1.seat_2.name))
     if match_2:
@@ -891,19 +1244,6 @@ def swap_opponents(player_1, opponent_1):
             flash("As a result, {} now has a BYE.".format(match_2.seat_1.name))
 
 
-def rank(p):
-    """
-    A key function that allows players to be sorted in rank order.
-    """
-
-    # Example: 12 points, with tie-breakers of 0.33, 1.00, and 0.90 becomes...
-    rank = p.points()               # 12.
-    rank += p.tb_1() / 10           #    033
-    rank += p.tb_2() / 10000        #       100
-    rank += p.tb_3() / 10000000     #          090
-    return rank                     # 12.03310009
-
-
 def flash_errors(form):
     for field, messages in form.errors.items():
         label = getattr(getattr(getattr(form, field), 'label'), 'text', '')
@@ -913,5 +1253,5 @@ def flash_errors(form):
         message = f'Error in {label}: {error}' if label else 'Error: {error}'
 
         flash(message)
-        print(message)
+        log.debug(message)
 